@@ -22,8 +22,18 @@
 
 """Post geojson formatted Alarms to a ReST-API."""
 
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.exceptions import RequestException
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Data payload to be posted - Example:
 # {"type": "Feature", "geometry": {"type": "Point", "coordinates": [15.860621, 61.403141]},
@@ -33,18 +43,91 @@ import requests
 
 LOG = logging.getLogger(__name__)
 
+HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+# (connect, read) timeouts in seconds:
+TIMEOUT = (3.05, 30)
+
+_SESSION = None
+
+
+def _get_session():
+    """Get the http session shared between posts, so connections are kept alive and reused."""
+    global _SESSION
+    if _SESSION is None:
+        # Only failed connections are retried, as POST is not an idempotent
+        # method and a retried post could create the alarm twice:
+        retries = Retry(total=3, backoff_factor=0.2)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retries)
+        _SESSION = requests.Session()
+        _SESSION.mount('https://', adapter)
+        _SESSION.mount('http://', adapter)
+
+    return _SESSION
+
+
+def _dumps(data):
+    """Serialize the data to json, returned as utf-8 encoded bytes.
+
+    Use orjson, which is much faster than the standard json module, when available.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data).encode('utf-8')
+
+
+def close_session():
+    """Close the http session and its pooled connections."""
+    global _SESSION
+    if _SESSION is not None:
+        _SESSION.close()
+        _SESSION = None
+
 
 def post_alarm(geojson_data, api_url, xauth=None):
     """Post an Alarm to a rest-api stored as a geojson file."""
+    post_alarms([geojson_data], api_url, xauth)
+
+
+def post_alarms(geojson_data_list, api_url, xauth=None, max_concurrency=8):
+    """Post a list of Alarms to a rest-api, several of them concurrently.
+
+    The alarms are posted from a bounded pool of threads sharing the same http
+    session, so the order in which they arrive at the api is not guaranteed. A
+    failing post does not stop the others: all alarms are posted before the
+    first error encountered is raised.
+    """
     if xauth is None:
-        headers = {"Content-Type": "application/json; charset=utf-8"}
+        headers = HEADERS
     else:
-        headers = {"Content-Type": "application/json; charset=utf-8",
-                   "x-auth-satellite-alarm": xauth}
+        headers = dict(HEADERS, **{"x-auth-satellite-alarm": xauth})
+
+    session = _get_session()
+    if len(geojson_data_list) == 1:
+        _post(session, geojson_data_list[0], api_url, headers)
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(geojson_data_list)))) as executor:
+        futures = [executor.submit(_post, session, geojson_data, api_url, headers)
+                   for geojson_data in geojson_data_list]
+
+    errors = []
+    for geojson_data, future in zip(geojson_data_list, futures):
+        try:
+            future.result()
+        except RequestException as err:
+            LOG.error("Failed posting alarm: %s - Data: %s", str(err), str(geojson_data))
+            errors.append(err)
+
+    if errors:
+        raise errors[0]
+
 
-    response = requests.post(api_url,
-                             headers=headers,
-                             json=geojson_data)
+def _post(session, geojson_data, api_url, headers):
+    """Post one Alarm using the http session."""
+    response = session.post(api_url,
+                            headers=headers,
+                            data=_dumps(geojson_data),
+                            timeout=TIMEOUT)
 
     LOG.info("Alarm posted: Response = %s", str(response))
     LOG.debug("Status code = %d", response.status_code)
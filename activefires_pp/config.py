@@ -22,21 +22,61 @@
 
 """Handling the yaml configurations."""
 
+import copy
+import logging
+import os
+import threading
 import yaml
-from yaml import UnsafeLoader, Loader
+try:
+    # The libyaml based loader is considerably faster than the pure Python one,
+    # but requires PyYAML to be built with libyaml:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+logger = logging.getLogger(__name__)
+
+# Parsed configurations per absolute file path: {path: ((mtime_ns, size, inode), config)}
+_CONFIG_CACHE = {}
+_CONFIG_CACHE_LOCK = threading.Lock()
 
 
 def read_config(config_filepath):
-    """Read and extract config information."""
-    with open(config_filepath, 'r') as fp_:
-        config = yaml.load(fp_, Loader=UnsafeLoader)
+    """Read and extract config information.
+
+    The parsed configuration is cached and reused as long as the file on disk
+    is unchanged (same modification time, size and inode). Each caller gets
+    its own copy of the configuration, which it is free to modify.
+    """
+    filepath = os.path.abspath(config_filepath)
+    fstat = os.stat(filepath)
+    signature = (fstat.st_mtime_ns, fstat.st_size, fstat.st_ino)
+
+    with _CONFIG_CACHE_LOCK:
+        cached = _CONFIG_CACHE.get(filepath)
+    if cached is not None and cached[0] == signature:
+        return copy.deepcopy(cached[1])
+
+    if SafeLoader is yaml.SafeLoader:
+        logger.debug("PyYAML is not built with libyaml - using the slower pure Python yaml loader.")
+    with open(filepath, 'r') as fp_:
+        config = yaml.load(fp_, Loader=SafeLoader)
+
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE[filepath] = (signature, config)
+
+    return copy.deepcopy(config)
+
 
-    return config
+def clear_config_cache():
+    """Clear the cache of parsed configurations."""
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE.clear()
 
 
 def get_xauthentication_token(xauth_filepath):
     """Get the X-Authentication-token needed for posting to the API."""
     with open(xauth_filepath, 'r') as fp_:
-        tokens = yaml.load(fp_, Loader=Loader)
+        tokens = yaml.load(fp_, Loader=SafeLoader)
 
     return tokens['xauth_tokens']['x-auth-satellite-alarm']
@@ -22,27 +22,35 @@
 
 """Creating and sending notifications for detected forest fires."""
 
+import base64
 import socket
+from collections import OrderedDict
 from netrc import netrc
 from datetime import datetime
+from functools import lru_cache
 import os
 import logging
+import mmap
 import signal
+import time
 from queue import Empty
+from threading import BoundedSemaphore
+from threading import Lock
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 from posttroll.listener import ListenerContainer
 from posttroll.message import Message
 from posttroll.publisher import NoisyPublisher
 import smtplib
-from pathlib import Path
+import email.policy
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
-from email import encoders
 
 from activefires_pp.config import read_config
 from activefires_pp.utils import get_filename_from_posttroll_message
-from activefires_pp.geojson_utils import read_geojson_data
+from activefires_pp.geojson_utils import iter_geojson_features
+from activefires_pp.geojson_utils import GeojsonReadError
 
 
 HOME = os.environ.get('HOME')
@@ -53,6 +61,12 @@ else:
 
 LOG = logging.getLogger(__name__)
 
+# Number of recent incoming messages remembered to skip redeliveries:
+MAX_SEEN_MESSAGES = 4096
+
+# Message data of the incoming file not passed on to the output message:
+_STRIP_KEYS = frozenset(('file', 'uri', 'uid', 'format', 'type'))
+
 
 class RecipientDataStruct(object):
     """A data structure to control the list of configured recipients."""
@@ -71,13 +85,12 @@ class RecipientDataStruct(object):
 
         One for those that should have an attachement (geojson file) and those without.
         """
-        self.recipients_all = list(set().union(recipients, recipients_attachment))
-        self.recipients_all.sort()
-        for recip in self.recipients_all:
-            if recip in recipients_attachment:
-                self.recipients_with_attachment.append(recip)
-            else:
-                self.recipients_without_attachment.append(recip)
+        recipients_attachment = set(recipients_attachment or [])
+        self.recipients_all = sorted(recipients_attachment.union(recipients or []))
+        self.recipients_with_attachment = [recip for recip in self.recipients_all
+                                           if recip in recipients_attachment]
+        self.recipients_without_attachment = [recip for recip in self.recipients_all
+                                              if recip not in recipients_attachment]
 
 
 class EndUserNotifier(Thread):
@@ -95,7 +108,10 @@ class EndUserNotifier(Thread):
 
         self.host = socket.gethostname()
         LOG.debug("netrc file path = %s", self._netrcfile)
-        self.secrets = netrc(self._netrcfile)
+        self._host_secrets = netrc(self._netrcfile).authenticators(self.host)
+        if self._host_secrets is None:
+            LOG.error("Failed getting authentication secrets for host: %s", self.host)
+            raise IOError("Check out the details in the netrc file: %s" % self._netrcfile)
 
         self.smtp_server = self.options.get('smtp_server')
         self.domain = self.options.get('domain')
@@ -109,6 +125,7 @@ class EndUserNotifier(Thread):
         LOG.debug("Max number of fires in SMS: %d", self.max_number_of_fires_in_sms)
 
         self.fire_data = self.options.get('fire_data')
+        self._compile_fire_data_formatters()
         self.unsubscribe_address = self.options.get('unsubscribe_address')
         self.unsubscribe_text = self.options.get('unsubscribe_text')
 
@@ -120,6 +137,15 @@ class EndUserNotifier(Thread):
 
         self.output_topic = self.options['publish_topic']
 
+        self._smtp = None
+        self._smtp_last_used = None
+        self._smtp_max_idle = self.options.get('smtp_max_idle', 240)
+        self._smtp_lock = Lock()
+        self._publisher_lock = Lock()
+        self._executor = None
+        # Limit the number of messages waiting for the sender threads:
+        self._pending_messages = BoundedSemaphore(self.options.get('max_pending_messages', 256))
+        self._seen_messages = OrderedDict()
         self.listener = None
         self.publisher = None
         self.loop = False
@@ -136,6 +162,7 @@ class EndUserNotifier(Thread):
         self.listener = ListenerContainer(topics=[self.input_topic])
         self.publisher = NoisyPublisher("end_user_notifier")
         self.publisher.start()
+        self._executor = ThreadPoolExecutor(max_workers=self.options.get('sender_concurrency', 4))
         self.loop = True
         signal.signal(signal.SIGTERM, self.signal_shutdown)
 
@@ -145,18 +172,10 @@ class EndUserNotifier(Thread):
             self.options[item] = config[item]
 
         if isinstance(self.options.get('subscribe_topics'), str):
-            subscribe_topics = self.options.get('subscribe_topics').split(',')
-            for item in subscribe_topics:
-                if len(item) == 0:
-                    subscribe_topics.remove(item)
-            self.options['subscribe_topics'] = subscribe_topics
+            self.options['subscribe_topics'] = [item for item in self.options['subscribe_topics'].split(',') if item]
 
         if isinstance(self.options.get('publish_topics'), str):
-            publish_topics = self.options.get('publish_topics').split(',')
-            for item in publish_topics:
-                if len(item) == 0:
-                    publish_topics.remove(item)
-            self.options['publish_topics'] = publish_topics
+            self.options['publish_topics'] = [item for item in self.options['publish_topics'].split(',') if item]
 
         unsubscribe = config.get('unsubscribe')
         if unsubscribe:
@@ -172,27 +191,79 @@ class EndUserNotifier(Thread):
         while self.loop:
             try:
                 msg = self.listener.output_queue.get(timeout=1)
-                LOG.debug("Message: %s", str(msg.data))
             except Empty:
                 continue
-            else:
-                if msg.type in ['info', ]:
-                    # No fires detected - no notification to send:
-                    LOG.info("Message type info: No fires detected - no notification to send.")
-                    continue
-                elif msg.type not in ['file', 'collection', 'dataset']:
-                    LOG.debug("Message type not supported: %s", str(msg.type))
-                    continue
-
-                if not self._product_name_supported(msg):
-                    continue
-
-                output_msg = self.notify_end_users(msg)
-                if output_msg:
-                    LOG.debug("Sending message: %s", str(output_msg))
-                    self.publisher.send(str(output_msg))
-                else:
-                    LOG.debug("No message to send")
+
+            self._dispatch_message(msg)
+
+    def _dispatch_message(self, msg):
+        """Hand over the incoming message to the sender threads, if it should generate notifications."""
+        LOG.debug("Message: %s", msg.data)
+        if msg.type in ['info', ]:
+            # No fires detected - no notification to send:
+            LOG.info("Message type info: No fires detected - no notification to send.")
+            return
+        elif msg.type not in ['file', 'collection', 'dataset']:
+            LOG.debug("Message type not supported: %s", str(msg.type))
+            return
+
+        if not self._product_name_supported(msg):
+            return
+
+        if self._already_seen(msg):
+            LOG.info("Message already handled, no new notification sent: %s", msg.data.get('uid'))
+            return
+
+        # Block the listener, and let the messages wait in the posttroll queue,
+        # if the sender threads are too far behind:
+        self._pending_messages.acquire()
+        try:
+            future = self._executor.submit(self._handle_message, msg)
+        except RuntimeError:
+            self._pending_messages.release()
+            LOG.warning("Notifier is shutting down, message not handled: %s", msg.data.get('uid'))
+            return
+        future.add_done_callback(lambda _: self._pending_messages.release())
+
+    def _already_seen(self, msg):
+        """Check if the message has been seen before, and remember it.
+
+        Redelivered messages, identified by the topic and the file uid/uri, are
+        recognised among the most recent MAX_SEEN_MESSAGES messages.
+        """
+        uid = msg.data.get('uid')
+        uri = msg.data.get('uri')
+        if uid is None and uri is None:
+            return False
+
+        key = (msg.subject, uid, uri)
+        if key in self._seen_messages:
+            self._seen_messages.move_to_end(key)
+            return True
+
+        self._seen_messages[key] = None
+        if len(self._seen_messages) > MAX_SEEN_MESSAGES:
+            self._seen_messages.popitem(last=False)
+        return False
+
+    def _handle_message(self, msg):
+        """Send the notifications for the incoming message and publish the result.
+
+        Run in one of the sender threads, so that the listener is not held up by
+        the smtp communication.
+        """
+        try:
+            output_msg = self.notify_end_users(msg)
+        except Exception:
+            LOG.exception("Failed sending notifications for message: %s", str(msg))
+            return
+
+        if output_msg:
+            LOG.debug("Sending message: %s", output_msg)
+            with self._publisher_lock:
+                self.publisher.send(str(output_msg))
+        else:
+            LOG.debug("No message to send")
 
     def _product_name_supported(self, incoming_msg):
         """Check that the product name is supported via the configuration."""
@@ -209,8 +280,8 @@ class EndUserNotifier(Thread):
         LOG.debug("Start sending notifications to configured end users.")
 
         filename = get_filename_from_posttroll_message(msg)
-        ffdata = read_geojson_data(filename)
-        if not ffdata:
+        features = iter_geojson_features(filename)
+        if features is None:
             return None
 
         platform_name = msg.data.get("platform_name")
@@ -219,139 +290,187 @@ class EndUserNotifier(Thread):
         # Some recipients (typically via e-mail) should have the full message and an attachment
         # Other recipients (typically via SMS) should have several smaller messages and no attachment
         #
-        full_message, sub_messages = self.create_message_content(ffdata['features'], "\n" + self.unsubscribe_text)
-
-        username, password = self._get_mailserver_login_credentials()
-        server = self._start_smtp_server(username, password, self.recipients)
+        try:
+            full_message, sub_messages = self.create_message_content(features, "\n" + self.unsubscribe_text)
+        except GeojsonReadError:
+            LOG.exception("Geojson file invalid and cannot be read: %s", str(filename))
+            return None
 
-        self._send_notifications_without_attachments(server, self.recipients, sub_messages, platform_name)
-        self._send_notifications_with_attachments(server, self.recipients, full_message, filename, platform_name)
+        self._send_notifications_without_attachments(self.recipients, sub_messages, platform_name)
+        self._send_notifications_with_attachments(self.recipients, full_message, filename, platform_name)
 
         return _create_output_message(msg, self.output_topic, self.recipients.recipients_all)
 
-    def _send_notifications_with_attachments(self, server, recipients, full_message, filename, platform_name):
-        """Send notifications with attachments."""
-        notification = MIMEMultipart()
-        notification['From'] = self.sender
-        if platform_name:
-            notification['Subject'] = recipients.subject + ' Satellit = %s' % platform_name
-        else:
-            notification['Subject'] = recipients.subject
+    def _send_notifications_with_attachments(self, recipients, full_message, filename, platform_name):
+        """Send notifications with attachments.
+
+        The notification is sent once to all recipients, which are only given as
+        the envelope recipients (like blind copies), with undisclosed recipients in the message header.
+        """
+        if not recipients.recipients_with_attachment:
+            return
 
         if recipients.region_name:
             full_message = recipients.region_name + ":\n" + full_message
 
-        notification.attach(MIMEText(full_message, 'plain', 'UTF-8'))
+        notification = self._create_notification(_get_subject(recipients, platform_name), full_message)
         LOG.debug("Length of message: %d", len(full_message))
 
         part = MIMEBase('application', "octet-stream")
-        with open(filename, 'rb') as file:
-            part.set_payload(file.read())
-            encoders.encode_base64(part)
+        part.set_payload(get_base64_encoded_file_content(filename))
+        part['Content-Transfer-Encoding'] = 'base64'
         part.add_header('Content-Disposition',
-                        'attachment; filename="{}"'.format(Path(filename).name))
+                        'attachment; filename="{}"'.format(os.path.basename(filename)))
         notification.attach(part)
 
-        for recip in recipients.recipients_with_attachment:
-            notification['To'] = recip
-            LOG.info("Send fire notification to %s", str(recip))
+        LOG.info("Send fire notification to %s", str(recipients.recipients_with_attachment))
+        LOG.debug("Subject: %s", str(recipients.subject))
+        # Serialized with CRLF line endings, as smtplib does not fix the line endings of bytes:
+        txt = notification.as_bytes(policy=email.policy.SMTP)
+        self._sendmail(recipients.recipients_with_attachment, txt)
+        LOG.debug("Text sent: %s", txt)
+
+    def _send_notifications_without_attachments(self, recipients, sub_messages, platform_name):
+        """Send notifications without attachments.
+
+        Each sub-message is sent once to all recipients, which are only given as
+        the envelope recipients (like blind copies), with undisclosed recipients in the message header.
+        """
+        if not recipients.recipients_without_attachment:
+            return
+
+        subject = _get_subject(recipients, platform_name)
+        for submsg in sub_messages:
+            notification = self._create_notification(subject, submsg)
+
+            LOG.info("Send fire notification to %s", str(recipients.recipients_without_attachment))
             LOG.debug("Subject: %s", str(recipients.subject))
-            txt = notification.as_string()
-            server.sendmail(self.sender, recip, txt)
+            txt = notification.as_bytes(policy=email.policy.SMTP)
+            self._sendmail(recipients.recipients_without_attachment, txt)
             LOG.debug("Text sent: %s", txt)
 
-        server.quit()
+    def _create_notification(self, subject, text):
+        """Create the notification mail with the text as the message body."""
+        notification = MIMEMultipart()
+        notification['From'] = self.sender
+        # The recipients are only given as envelope recipients, and kept hidden:
+        notification['To'] = 'undisclosed-recipients:;'
+        notification['Subject'] = subject
+        notification.attach(MIMEText(text, 'plain', 'UTF-8'))
+        return notification
+
+    def _sendmail(self, to_addrs, txt):
+        """Send the mail, and reconnect to the smtp server once if the connection was lost.
 
-    def _send_notifications_without_attachments(self, server, recipients, sub_messages, platform_name):
-        """Send notifications without attachments."""
-        for submsg in sub_messages:
-            notification = MIMEMultipart()
-            notification['From'] = self.sender
-            if platform_name:
-                notification['Subject'] = recipients.subject + ' Satellit = %s' % platform_name
-            else:
-                notification['Subject'] = recipients.subject
-
-            notification.attach(MIMEText(submsg, 'plain', 'UTF-8'))
-
-            for recip in recipients.recipients_without_attachment:
-                notification['To'] = recip
-                LOG.info("Send fire notification to %s", str(recip))
-                LOG.debug("Subject: %s", str(recipients.subject))
-                txt = notification.as_string()
-                server.sendmail(self.sender, recip, txt)
-                LOG.debug("Text sent: %s", txt)
+        The smtp connection is shared by the sender threads, one mail at the time.
+        Recipients refused by the server, while the mail was sent to the others, are logged.
+        """
+        with self._smtp_lock:
+            try:
+                refused = self._get_smtp_server().sendmail(self.sender, to_addrs, txt)
+            except smtplib.SMTPServerDisconnected:
+                LOG.warning("Lost connection to the smtp server - reconnecting.")
+                self._smtp = None
+                refused = self._get_smtp_server().sendmail(self.sender, to_addrs, txt)
+
+        for recipient, (code, response) in refused.items():
+            LOG.error("Notification refused for recipient %s: %s %s", recipient, code, response)
+
+    def _get_smtp_server(self):
+        """Get the connection to the smtp server, which is kept open between the notifications.
+
+        A connection left idle for longer than the configured smtp_max_idle
+        seconds is closed and opened again, rather than risking that the server
+        has already dropped it.
+        """
+        now = time.monotonic()
+        if (self._smtp is not None and self._smtp_last_used is not None and
+                now - self._smtp_last_used > self._smtp_max_idle):
+            LOG.debug("Smtp connection idle for more than %d seconds - reconnecting.", self._smtp_max_idle)
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+        if self._smtp is None:
+            username, password = self._get_mailserver_login_credentials()
+            self._smtp = self._start_smtp_server(username, password)
+
+        self._smtp_last_used = now
+        return self._smtp
 
     def _get_mailserver_login_credentials(self):
         """Get the login credentials for the mail server."""
-        host_secrets = self.secrets.authenticators(self.host)
-        if host_secrets is None:
-            LOG.error("Failed getting authentication secrets for host: %s", self.host)
-            raise IOError("Check out the details in the netrc file: %s", self._netrcfile)
-
-        username, _, password = host_secrets
+        username, _, password = self._host_secrets
 
         return username, password
 
-    def _start_smtp_server(self, username, password, recipients):
+    def _start_smtp_server(self, username, password):
         """Start the smtp server and loging."""
         server = smtplib.SMTP(self.smtp_server)
         server.starttls()
         server.ehlo(self.domain)
-        server.rcpt(recipients.recipients_all)
         server.login(username, password)
 
         return server
 
-    def create_message_content(self, gjson_features, unsubscr):
-        """Create the full message string and the list of sub-messages."""
-        full_msg = ''
-        msg_list = []
-        outstr = ''
-        for idx, firespot in enumerate(gjson_features):
-            if idx % self.max_number_of_fires_in_sms == 0 and idx > 0:
-                full_msg = full_msg + outstr
-                if len(unsubscr) > 0:
-                    outstr = outstr + unsubscr
-
-                LOG.debug('%d: Sub message = <%s>', idx, outstr)
-                msg_list.append(outstr)
-                outstr = ''
-
-            lonlats = firespot['geometry']['coordinates']
-            outstr = outstr + '%f N, %f E\n' % (lonlats[1], lonlats[0])
-            if ('observation_time' in self.fire_data and
-                    'observation_time' in firespot['properties']):
-                timestr = firespot['properties']['observation_time']
-                LOG.debug("Time string: %s", str(timestr))
-                try:
-                    dtobj = datetime.fromisoformat(timestr)
-                    # Python > 3.6
-                except AttributeError:
-                    dtobj = datetime.strptime(timestr.split('.')[0], '%Y-%m-%dT%H:%M:%S')
+    def _compile_fire_data_formatters(self):
+        """Precompile the formatting of the configured fire properties going into the notifications."""
+        fire_data = self.fire_data or []
+        self._with_observation_time = 'observation_time' in fire_data
+        self._property_formatters = [(prop, _get_property_format(prop))
+                                     for prop in fire_data if prop != 'observation_time']
+
+        # The format of a detection having all the configured properties, rendered in one go:
+        self._firespot_keys = [prop for prop, _ in self._property_formatters]
+        firespot_format = ['%f N, %f E\n']
+        if self._with_observation_time:
+            self._firespot_keys.insert(0, 'observation_time')
+            firespot_format.append('  %s\n')
+        firespot_format.extend(prop_format for _, prop_format in self._property_formatters)
+        self._firespot_format = ''.join(firespot_format)
+
+    def _render_firespot(self, firespot):
+        """Render the position and the configured properties of one fire detection as text."""
+        lonlats = firespot['geometry']['coordinates']
+        properties = firespot['properties']
+        try:
+            values = [properties[key] for key in self._firespot_keys]
+        except KeyError:
+            pass
+        else:
+            if self._with_observation_time:
+                values[0] = _get_observation_time_string(values[0])
+            return self._firespot_format % (lonlats[1], lonlats[0], *values)
 
-                outstr = outstr + '  %s\n' % dtobj.strftime('%d %b %H:%M')
+        parts = ['%f N, %f E\n' % (lonlats[1], lonlats[0])]
+        if self._with_observation_time and 'observation_time' in properties:
+            parts.append('  %s\n' % _get_observation_time_string(properties['observation_time']))
 
-            for prop in firespot['properties']:
-                if prop in self.fire_data and prop not in ['observation_time']:
-                    if prop in ['power', 'Power']:
-                        outstr = outstr + '  FRP: %7.3f MW\n' % (firespot['properties'][prop])
-                    else:
-                        outstr = outstr + ' FRP: %s\n' % (str(firespot['properties'][prop]))
+        for prop, prop_format in self._property_formatters:
+            if prop in properties:
+                parts.append(prop_format % (properties[prop], ))
 
-            LOG.debug("Message length so far: %d", len(outstr))
-            LOG.debug("Max number of fires in sub message: %d", self.max_number_of_fires_in_sms)
+        return ''.join(parts)
 
-        if len(outstr) > 0:
-            if len(unsubscr) > 0:
-                outstr = outstr + unsubscr
-            LOG.debug('%d: Sub message = <%s>', idx, outstr)
-            msg_list.append(outstr)
+    def create_message_content(self, gjson_features, unsubscr):
+        """Create the full message string and the list of sub-messages.
+
+        The geojson features may be given as any iterable, like a stream of features read from file.
+        """
+        firespots = [self._render_firespot(firespot) for firespot in gjson_features]
 
-        full_msg = full_msg + outstr
+        nfires = self.max_number_of_fires_in_sms
+        LOG.debug("Max number of fires in sub message: %d", nfires)
+        msg_list = [''.join(firespots[idx:idx + nfires]) + unsubscr
+                    for idx in range(0, len(firespots), nfires)]
+
+        # Join everything in one go, as the full message may become large:
+        full_msg = ''.join(firespots + [unsubscr]) if firespots else ''
 
         LOG.debug("Full message: <%s>", full_msg)
-        LOG.debug("Sub-messages: <%s>", str(msg_list))
+        LOG.debug("Sub-messages: <%s>", msg_list)
 
         return full_msg, msg_list
 
@@ -363,11 +482,21 @@ class EndUserNotifier(Thread):
             self.listener.stop()
         except Exception:
             LOG.exception("Couldn't stop listener.")
+        if self._executor:
+            # Let the notifications already handed over be sent:
+            self._executor.shutdown(wait=True)
         if self.publisher:
             try:
                 self.publisher.stop()
             except Exception:
                 LOG.exception("Couldn't stop publisher.")
+        with self._smtp_lock:
+            if self._smtp:
+                try:
+                    self._smtp.quit()
+                except Exception:
+                    LOG.exception("Couldn't close the connection to the smtp server.")
+                self._smtp = None
 
 
 class EndUserNotifierRegional(EndUserNotifier):
@@ -378,19 +507,23 @@ class EndUserNotifierRegional(EndUserNotifier):
 
     def __init__(self, configfile, netrcfile=NETRCFILE):
         """Initialize the EndUserNotifierRegional class."""
-        super(EndUserNotifierRegional, self).__init__(configfile, netrcfile=NETRCFILE)
+        super(EndUserNotifierRegional, self).__init__(configfile, netrcfile=netrcfile)
 
     def _set_recipients(self):
-        """Set the recipients lists."""
-        self.recipients = self.options.get('recipients')
+        """Set the recipients lists, for each of the regions."""
+        self.recipients = self.options.get('recipients') or {}
+        self._recipients_per_region = {}
+        for region_id in self.recipients:
+            recpt = _get_region_recipients(self.recipients[region_id])
+            self._recipients_per_region[recpt.region_code] = recpt
 
     def notify_end_users(self, msg):
         """Send notifications to configured end users (mail and text messages)."""
         LOG.debug("Start sending notifications to configured end users.")
 
         filename = get_filename_from_posttroll_message(msg)
-        ffdata = read_geojson_data(filename)
-        if not ffdata:
+        features = iter_geojson_features(filename)
+        if features is None:
             return None
 
         platform_name = msg.data.get("platform_name")
@@ -399,49 +532,93 @@ class EndUserNotifierRegional(EndUserNotifier):
         # Some recipients (typically via e-mail) should have the full message and an attachment
         # Other recipients (typically via SMS) should have several smaller messages and no attachment
         #
-        full_message, sub_messages = self.create_message_content(ffdata['features'], "\n" + self.unsubscribe_text)
+        try:
+            full_message, sub_messages = self.create_message_content(features, "\n" + self.unsubscribe_text)
+        except GeojsonReadError:
+            LOG.exception("Geojson file invalid and cannot be read: %s", str(filename))
+            return None
 
         region_code = msg.data.get("region_code")
-        recipients = get_recipients_for_region(self.recipients, region_code)
+        recipients = self._recipients_per_region.get(region_code)
         if not recipients:
-            LOG.warning("No recipients configured for this region! Region code = ", str(region_code))
+            LOG.warning("No recipients configured for this region! Region code = %s", str(region_code))
             return
 
         regional_output_topic = self.output_topic + '/' + recipients.region_code
 
-        username, password = self._get_mailserver_login_credentials()
-        server = self._start_smtp_server(username, password, recipients)
-
-        self._send_notifications_without_attachments(server, recipients, sub_messages, platform_name)
-        self._send_notifications_with_attachments(server, recipients, full_message, filename, platform_name)
+        self._send_notifications_without_attachments(recipients, sub_messages, platform_name)
+        self._send_notifications_with_attachments(recipients, full_message, filename, platform_name)
 
         return _create_output_message(msg, regional_output_topic, recipients.recipients_all)
 
 
 def _create_output_message(msg, topic, recipients):
     """Create the output message from the input message."""
-    to_send = msg.data.copy()
-    to_send.pop('file', None)
-    to_send.pop('uri', None)
-    to_send.pop('uid', None)
-    to_send.pop('format', None)
-    to_send.pop('type', None)
+    to_send = {key: value for key, value in msg.data.items() if key not in _STRIP_KEYS}
     to_send['info'] = "Notifications sent to the following recipients: %s" % str(recipients)
 
     return Message(topic, 'info', to_send)
 
 
+def get_base64_encoded_file_content(filename):
+    """Get the base64 encoded content of the file, as attached to the notifications.
+
+    The encoded content of the most recent files is cached, as long as the file is not modified.
+    """
+    fstat = os.stat(filename)
+    return _encode_file_content(str(filename), fstat.st_mtime_ns, fstat.st_size)
+
+
+@lru_cache(maxsize=8)
+def _encode_file_content(filepath, mtime_ns, size):
+    """Read and base64 encode the file content, cached on the file path, modification time and size.
+
+    The file is memory mapped, so its content is encoded without first being read into memory.
+    """
+    if size == 0:
+        return ''
+    with open(filepath, 'rb') as fpt, mmap.mmap(fpt.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return base64.encodebytes(mapped).decode('ascii')
+
+
+def _get_subject(recipients, platform_name):
+    """Get the subject of the notifications, with the platform name if available."""
+    if platform_name:
+        return recipients.subject + ' Satellit = %s' % platform_name
+    return recipients.subject
+
+
+def _get_property_format(prop):
+    """Get the string format of a fire property as presented in the notifications."""
+    if prop in ['power', 'Power']:
+        return '  FRP: %7.3f MW\n'
+    return ' FRP: %s\n'
+
+
+@lru_cache(maxsize=1024)
+def _get_observation_time_string(timestr):
+    """Get the observation time as presented in the notifications from the iso time string.
+
+    Cached, as the detections of a granule usually share the same observation time.
+    """
+    dtobj = datetime.fromisoformat(timestr.replace('Z', '+00:00'))
+    return dtobj.strftime('%d %b %H:%M')
+
+
 def get_recipients_for_region(recipients, region_code):
     """Get the recipients lists applicable to the region."""
     for region_id in recipients:
-        rcode = recipients[region_id]['Kod_omr']
-        if rcode == region_code:
-            recpt = RecipientDataStruct()
-            recpt._set_recipients(recipients[region_id]['recipients'],
-                                  recipients[region_id]['recipients_attachment'])
-            recpt.region_name = recipients[region_id]['name']
-            recpt.region_code = rcode
-            recpt.subject = recipients[region_id]['subject']
-            return recpt
+        if recipients[region_id]['Kod_omr'] == region_code:
+            return _get_region_recipients(recipients[region_id])
 
     return None
+
+
+def _get_region_recipients(region):
+    """Get the recipients data structure from the configuration of one region."""
+    recpt = RecipientDataStruct()
+    recpt._set_recipients(region['recipients'], region['recipients_attachment'])
+    recpt.region_name = region['name']
+    recpt.region_code = region['Kod_omr']
+    recpt.subject = region['subject']
+    return recpt
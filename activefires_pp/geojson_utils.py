@@ -23,32 +23,92 @@
 """Geojson utilities."""
 
 import os
-import pyproj
-import geojson
-from geojson import Feature, Point, FeatureCollection, dump
+import math
+from functools import lru_cache
+from geojson import FeatureCollection, dump
 import json
 import logging
-from trollsift import Parser, globify
+from trollsift import globify
 import pytz
 from datetime import datetime
 
 import numpy as np
 from activefires_pp.utils import json_serial
+from activefires_pp.utils import get_trollsift_parser
+from activefires_pp.utils import get_transformer_from_lonlat
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+    json_loads = orjson.loads
+else:
+    json_loads = json.loads
+
+# Buffer size used when writing the Geojson files with the standard json encoder:
+WRITE_BUFFER_SIZE = 1 << 20
 
 logger = logging.getLogger(__name__)
 
 
+class GeojsonReadError(ValueError):
+    """Error raised when the Geojson file is invalid and cannot be read."""
+
+
 def read_geojson_data(filename):
-    """Read Geo json data from file."""
+    """Read Geo json data from file.
+
+    The content is returned as plain python dictionaries and lists, parsed with
+    orjson if available.
+    """
     if str(filename).endswith('.geojson') and filename.exists():
-        # Read the file:
+        with open(filename, "rb") as fpt:
+            content = fpt.read()
         try:
-            with open(filename, "r") as fpt:
-                return geojson.load(fpt)
+            return json_loads(content)
         except json.decoder.JSONDecodeError:
             logger.exception("Geojson file invalid and cannot be read: %s", str(filename))
-    else:
-        logger.error("No valid filename to read: %s", str(filename))
+            return None
+
+    logger.error("No valid filename to read: %s", str(filename))
+
+
+def iter_geojson_features(filename):
+    """Get an iterator over the features of a Geojson feature collection on file.
+
+    With ijson available the features are streamed from the file one at the
+    time, instead of holding the entire collection in memory. If the file
+    content is invalid a GeojsonReadError is raised during the iteration.
+    """
+    if str(filename).endswith('.geojson') and filename.exists():
+        return _iter_features_from_file(filename)
+
+    logger.error("No valid filename to read: %s", str(filename))
+    return None
+
+
+def _iter_features_from_file(filename):
+    """Iterate over the features of the Geojson feature collection in the file."""
+    with open(filename, "rb") as fpt:
+        if ijson is None:
+            try:
+                features = json_loads(fpt.read())['features']
+            except json.decoder.JSONDecodeError as err:
+                raise GeojsonReadError("Geojson file invalid and cannot be read: %s" % str(filename)) from err
+            yield from features
+            return
+        try:
+            yield from ijson.items(fpt, 'features.item', use_float=True)
+        except ijson.JSONError as err:
+            raise GeojsonReadError("Geojson file invalid and cannot be read: %s" % str(filename)) from err
 
 
 def get_geojson_files_in_observation_time_order(path, pattern, time_interval):
@@ -58,23 +118,28 @@ def get_geojson_files_in_observation_time_order(path, pattern, time_interval):
     if not dtime_end:
         dtime_end = datetime.utcnow()
 
-    p__ = Parser(pattern)
-    files = path.glob(globify(pattern))
-    dtimes = []
-    fnames = []
+    files = path.glob(_globify(pattern))
+    dtimes_and_fnames = []
     for gjson_file in files:
         fname = gjson_file.name
-        res = p__.parse(fname)
-        if res['start_time'] > dtime_start and res['start_time'] < dtime_end:
-            dtimes.append(res['start_time'])
-            fnames.append(fname)
+        start_time = _get_start_time_from_filename(pattern, fname)
+        if start_time > dtime_start and start_time < dtime_end:
+            dtimes_and_fnames.append((start_time, fname))
+
+    dtimes_and_fnames.sort()
+    return [fname for _, fname in dtimes_and_fnames]
 
-    dtimes = np.array(dtimes)
-    fnames = np.array(fnames)
 
-    idx = dtimes.argsort()
-    files = np.take(fnames, idx)
-    return files.tolist()
+@lru_cache(maxsize=4096)
+def _get_start_time_from_filename(pattern, fname):
+    """Get the start time from the file name, cached as the same files are checked over and over."""
+    return get_trollsift_parser(pattern).parse(fname)['start_time']
+
+
+@lru_cache(maxsize=32)
+def _globify(pattern):
+    """Get the glob string of the file name pattern, created once per pattern."""
+    return globify(pattern)
 
 
 def geojson_feature_collection_from_detections(detections, platform_name=None):
@@ -82,58 +147,73 @@ def geojson_feature_collection_from_detections(detections, platform_name=None):
     if len(detections) == 0:
         raise ValueError("No detections to save!")
 
+    # Extract the columns once, instead of looking up each row of the data frame:
+    # Coordinates rounded to 6 decimals, like the geojson library does for a Point:
+    lons = [round(lon, 6) for lon in detections['longitude'].to_numpy(dtype=np.float64).tolist()]
+    lats = [round(lat, 6) for lat in detections['latitude'].to_numpy(dtype=np.float64).tolist()]
+    powers = detections['power'].tolist()
+    tbs = detections['tb'].tolist()
+    # A missing confidence (NaN) is written as null:
+    confidences = [None if math.isnan(conf) else int(conf)
+                   for conf in detections['conf'].to_numpy(dtype=np.float64).tolist()]
+    starttimes = detections['starttime'].to_numpy(dtype='datetime64[us]').tolist()
+    endtimes = detections['endtime'].to_numpy(dtype='datetime64[us]').tolist()
+    # The start and end times are normally the same for all detections of a granule,
+    # so compute the mean observation time only once for each start/end time pair:
+    mean_times = {(starttime, endtime): json_serial(starttime + (endtime - starttime) / 2.)
+                  for starttime, endtime in set(zip(starttimes, endtimes))}
+    observation_times = [mean_times[times] for times in zip(starttimes, endtimes)]
+
+    optional_columns = []
+    if 'tb_celcius' in detections.columns:
+        optional_columns.append(('tb_celcius', detections['tb_celcius'].tolist()))
+    else:
+        logger.debug("Failed adding the TB in celcius!")
+    if 'detection_id' in detections.columns:
+        optional_columns.append(('id', detections['detection_id'].tolist()))
+    else:
+        logger.debug("Failed adding the unique detection id!")
+
+    common_properties = {}
+    if platform_name:
+        common_properties['platform_name'] = platform_name
+    else:
+        logger.debug("No platform name specified for output")
+
     # Convert points to GeoJSON
     features = []
     for idx in range(len(detections)):
-        starttime = detections.iloc[idx].starttime
-        endtime = detections.iloc[idx].endtime
-        mean_granule_time = starttime.to_pydatetime() + (endtime.to_pydatetime() -
-                                                         starttime.to_pydatetime()) / 2.
-
-        prop = {'power': detections.iloc[idx].power,
-                'tb': detections.iloc[idx].tb,
-                'confidence': int(detections.iloc[idx].conf),
-                'observation_time': json_serial(mean_granule_time)
+        prop = {'power': powers[idx],
+                'tb': tbs[idx],
+                'confidence': confidences[idx],
+                'observation_time': observation_times[idx]
                 }
+        for key, values in optional_columns:
+            prop[key] = values[idx]
+        prop.update(common_properties)
 
-        try:
-            prop['tb_celcius'] = detections.iloc[idx].tb_celcius
-        except AttributeError:
-            logger.debug("Failed adding the TB in celcius!")
-            pass
-        try:
-            prop['id'] = detections.iloc[idx].detection_id
-        except AttributeError:
-            logger.debug("Failed adding the unique detection id!")
-            pass
-
-        if platform_name:
-            prop['platform_name'] = platform_name
-        else:
-            logger.debug("No platform name specified for output")
-
-        feat = Feature(
-            geometry=Point(map(float, [detections.iloc[idx].longitude, detections.iloc[idx].latitude])),
-            properties=prop)
-        features.append(feat)
+        # The features are built as plain dicts, which is much cheaper than the geojson objects:
+        features.append({'type': 'Feature',
+                         'geometry': {'type': 'Point', 'coordinates': [lons[idx], lats[idx]]},
+                         'properties': prop})
 
     return FeatureCollection(features)
 
 
 def map_coordinates_in_feature_collection(feature_collection, epsg_str):
     """Map the Point coordinates of all data in Feature Collection."""
-    outp = pyproj.Proj(init=epsg_str)
-
-    mapped_features = []
-    # Iterate through each feature of the feature collection
-    for feature in feature_collection['features']:
-        lon, lat = feature['geometry']['coordinates']
-        prop = feature['properties']
-        feature_out = Feature(geometry=Point(map(float, [lon, lat])), properties=prop)
-        # Project/transform coordinate pairs of each Point
-        result = outp(lon, lat)
-        feature_out['geometry']['coordinates'] = [result[0], result[1]]
-        mapped_features.append(feature_out)
+    features = feature_collection['features']
+    lons = np.array([feature['geometry']['coordinates'][0] for feature in features], dtype=np.float64)
+    lats = np.array([feature['geometry']['coordinates'][1] for feature in features], dtype=np.float64)
+    # Project/transform the coordinate pairs of all Points in one go:
+    xcoords, ycoords = get_transformer_from_lonlat(epsg_str).transform(lons, lats)
+
+    # Build the (geojson) features directly as plain dicts, which also avoids
+    # the rounding of the coordinates done by the geojson Point:
+    mapped_features = [{'type': 'Feature',
+                        'geometry': {'type': 'Point', 'coordinates': [xcoord, ycoord]},
+                        'properties': feature['properties']}
+                       for feature, xcoord, ycoord in zip(features, xcoords.tolist(), ycoords.tolist())]
 
     return FeatureCollection(mapped_features)
 
@@ -147,8 +227,7 @@ def store_geojson_alarm(fires_alarms_dir, file_parser, idx, alarm):
     fname = file_parser.compose({'start_time': start_time, 'id': idx,
                                  'platform_name': platform_name})
     output_filename = fires_alarms_dir / fname
-    with open(output_filename, 'w') as fpt:
-        dump(alarm, fpt)
+    _write_geojson(output_filename, alarm)
 
     return output_filename
 
@@ -160,5 +239,19 @@ def store_geojson(output_filename, feature_collection):
         logger.info("Create directory: %s", path)
         os.makedirs(path)
 
-    with open(output_filename, 'w') as fpt:
-        dump(feature_collection, fpt)
+    _write_geojson(output_filename, feature_collection)
+
+
+def _write_geojson(output_filename, geojson_data):
+    """Write the Geojson data to file.
+
+    Serialize with orjson, in one go, if available, otherwise use the (slower)
+    geojson encoder writing through a large file buffer.
+    """
+    if orjson is not None:
+        with open(output_filename, 'wb') as fpt:
+            fpt.write(orjson.dumps(geojson_data, default=json_serial, option=orjson.OPT_SERIALIZE_NUMPY))
+        return
+
+    with open(output_filename, 'w', buffering=WRITE_BUFFER_SIZE) as fpt:
+        dump(geojson_data, fpt)
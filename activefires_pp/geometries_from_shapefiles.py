@@ -24,7 +24,10 @@
 
 from glob import glob
 import os
+from functools import lru_cache
+import numpy as np
 import cartopy.io.shapereader as shpreader
+import shapely
 import pycrs
 
 
@@ -36,24 +39,55 @@ class ShapeGeometry(object):
         self.filepaths = _get_shapefile_paths(shapefilepath, globstr)
         self.geometries = []
         self.attributes = []
+        self._polygons = {}
+        self._polygons_tree = None
         self._get_proj()
 
     def load(self):
         """Load the geometries and the associated attributes."""
-        records = []
+        self.geometries = []
+        self.attributes = []
         for filepath in self.filepaths:
-            records = records + [r for r in shpreader.Reader(filepath).records()]
+            geometries, attributes = _read_records(filepath)
+            self.geometries.extend(geometries)
+            self.attributes.extend(attributes)
+
+        self._polygons = {}
+        self._polygons_tree = None
+
+    def get_polygons(self, index):
+        """Get the polygons of a (multi-)polygon geometry, prepared for fast point in polygon tests.
+
+        The polygons are prepared once per geometry and kept with the loaded geometries.
+        """
+        if index not in self._polygons:
+            self._polygons[index] = get_prepared_polygons(self.geometries[index])
+
+        return self._polygons[index]
 
-        self._records = records
-        self._load_member_from_records('geometries', 'geometry')
-        self._load_member_from_records('attributes', 'attributes')
+    def get_polygons_tree(self):
+        """Get a spatial index (STR-tree) over the polygons of all the geometries.
+
+        The tree is returned together with the index of the geometry each of the polygons in the tree belongs to.
+        """
+        if self._polygons_tree is None:
+            polygons = []
+            geometry_indices = []
+            for index in range(len(self.geometries)):
+                geometry_polygons = self.get_polygons(index)
+                polygons.extend(geometry_polygons)
+                geometry_indices.extend([index] * len(geometry_polygons))
+
+            self._polygons_tree = (shapely.STRtree(polygons), np.array(geometry_indices, dtype=np.intp))
+
+        return self._polygons_tree
 
     def _get_proj(self):
         """Get and return the Proj.4 string."""
         self.proj4str = []
         for filepath in self.filepaths:
             prj_filename = _get_proj_filename_from_shapefile(filepath)
-            crs = pycrs.load.from_file(prj_filename)
+            crs = _load_crs(prj_filename)
             if crs.name == 'SWEREF99_TM' and crs.proj.name.proj4 == 'utm':
                 utm_zone_proj4 = ' +zone=33'
                 proj4str = crs.to_proj4() + utm_zone_proj4
@@ -68,9 +102,30 @@ class ShapeGeometry(object):
 
         self.proj4str = first_proj4_str
 
-    def _load_member_from_records(self, class_member, record_type):
-        """Load a member of the shapely.geometry object and set the corresponding class member."""
-        setattr(self, class_member, [getattr(rec, record_type) for rec in self._records])
+
+def get_prepared_polygons(geometry):
+    """Get the polygons, with their holes, of a (multi-)polygon geometry prepared for point in polygon tests."""
+    polygons = np.array(getattr(geometry, 'geoms', [geometry]), dtype=object)
+    shapely.prepare(polygons)
+    return list(polygons)
+
+
+def load_shape_geometry(shapefilepath, globstr='*.shp'):
+    """Get the shape geometry with the geometries and attributes loaded from the shapefile(s).
+
+    The loaded shape geometry is cached, and reused as long as the shapefiles are not modified.
+    """
+    filepaths = tuple(_get_shapefile_paths(shapefilepath, globstr))
+    mtimes = tuple(os.stat(filepath).st_mtime_ns for filepath in filepaths)
+    return _load_shape_geometry(str(shapefilepath), globstr, filepaths, mtimes)
+
+
+@lru_cache(maxsize=8)
+def _load_shape_geometry(shapefilepath, globstr, filepaths, mtimes):
+    """Load the shape geometry, cached on the shapefile paths and their modification times."""
+    shape_geom = ShapeGeometry(shapefilepath, globstr)
+    shape_geom.load()
+    return shape_geom
 
 
 def _get_shapefile_paths(path, globstr='*.shp'):
@@ -88,5 +143,31 @@ def _get_shapefile_paths(path, globstr='*.shp'):
     return shapefile_paths
 
 
+def _read_records(filepath):
+    """Read the geometries and the attributes of all the records of a shapefile, in one pass over the records."""
+    geometries = []
+    attributes = []
+    for record in shpreader.Reader(filepath).records():
+        geometries.append(record.geometry)
+        attributes.append(record.attributes)
+    return geometries, attributes
+
+
 def _get_proj_filename_from_shapefile(filepath):
-    return filepath.split('.shp')[0] + '.prj'
+    return os.path.splitext(filepath)[0] + '.prj'
+
+
+def _load_crs(prj_filename):
+    """Load the coordinate reference system from the prj file, cached as long as the file is not modified."""
+    try:
+        mtime_ns = os.stat(prj_filename).st_mtime_ns
+    except OSError:
+        return pycrs.load.from_file(prj_filename)
+
+    return _load_crs_from_file(prj_filename, mtime_ns)
+
+
+@lru_cache(maxsize=32)
+def _load_crs_from_file(prj_filename, mtime_ns):
+    """Load the coordinate reference system from the prj file, cached on the file path and modification time."""
+    return pycrs.load.from_file(prj_filename)
@@ -23,13 +23,13 @@
 """Post processing on the Active Fire detections."""
 
 import socket
-from trollsift import Parser, globify
+from trollsift import globify
 import time
 import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
 import os
-from six.moves.urllib.parse import urlparse
+from urllib.parse import urlsplit
 
 import logging
 import signal
@@ -38,20 +38,21 @@ from threading import Thread
 from posttroll.listener import ListenerContainer
 from posttroll.message import Message
 from posttroll.publisher import NoisyPublisher
-import pyproj
-from matplotlib.path import Path
 import shapely
 
 from activefires_pp.utils import datetime_utc2local
 from activefires_pp.utils import UnitConverter
 from activefires_pp.utils import get_local_timezone_offset
+from activefires_pp.utils import get_trollsift_parser
+from activefires_pp.utils import get_transformer_from_lonlat
 from activefires_pp.config import read_config
-from activefires_pp.geometries_from_shapefiles import ShapeGeometry
+from activefires_pp.geometries_from_shapefiles import load_shape_geometry
+from activefires_pp.geometries_from_shapefiles import get_prepared_polygons
 
 from activefires_pp.geojson_utils import store_geojson
 from activefires_pp.geojson_utils import geojson_feature_collection_from_detections
 from activefires_pp.geojson_utils import map_coordinates_in_feature_collection
-from activefires_pp.sanity_check_detections import remove_spurious_detections
+from activefires_pp.sanity_check_detections import get_spurious_detections_mask
 
 # M-band output:
 # column 1: latitude of fire pixel (degrees)
@@ -73,9 +74,15 @@ from activefires_pp.sanity_check_detections import remove_spurious_detections
 # column 7: fire radiative power (MW)
 #
 COL_NAMES = ["latitude", "longitude", "tb", "along_scan_res", "along_track_res", "conf", "power"]
+# The confidence is read as a float, so that a missing value (NaN) does not fail the whole file:
+COL_DTYPES = {"latitude": np.float64, "longitude": np.float64, "tb": np.float64,
+              "along_scan_res": np.float64, "along_track_res": np.float64, "conf": np.float64, "power": np.float64}
 
 NO_FIRES_TEXT = 'No fire detections for this granule'
 
+# Message data of the incoming file not passed on to the output message:
+_STRIP_KEYS = frozenset(('dataset', 'collection', 'uri', 'uid', 'format', 'type'))
+
 
 logger = logging.getLogger(__name__)
 logging.getLogger("fiona").setLevel(logging.WARNING)
@@ -89,8 +96,12 @@ class ActiveFiresShapefileFiltering(object):
     Data is stored in geojson format.
     """
 
-    def __init__(self, filepath=None, afdata=None, platform_name=None, timezone='GMT'):
-        """Initialize the ActiveFiresShapefileFiltering class."""
+    def __init__(self, filepath=None, afdata=None, platform_name=None, timezone='GMT', projected_points=None):
+        """Initialize the ActiveFiresShapefileFiltering class.
+
+        The *projected_points* already kept by another instance for the same
+        detections can be given, so that they are not projected again.
+        """
         self.input_filepath = filepath
         self.afdata = afdata
         if afdata is None:
@@ -100,12 +111,16 @@ class ActiveFiresShapefileFiltering(object):
 
         self.timezone = timezone
         self.platform_name = platform_name
+        # The (proj4str, detections, points) of the detections last projected:
+        self.projected_points = projected_points
 
     def get_af_data(self, filepattern=None, localtime=True):
         """Read the Active Fire results from file - ascii formatted output from CSPP VIIRS-AF."""
         if self.afdata is not None:
-            # Make sure the attrs are populated with metadata instance attribute
-            self.afdata.attrs.update(self.metadata)
+            # Make sure the attrs are populated with metadata instance attribute,
+            # unless they are the very same dictionary:
+            if self.afdata.attrs is not self.metadata:
+                self.afdata.attrs.update(self.metadata)
             return self.afdata
 
         if not self.input_filepath or not os.path.exists(self.input_filepath):
@@ -138,12 +153,11 @@ class ActiveFiresShapefileFiltering(object):
         starttime = starttime.replace(tzinfo=None)
         endtime = endtime.replace(tzinfo=None)
 
-        self.afdata['starttime'] = np.repeat(starttime, len(self.afdata)).astype(np.datetime64)
-        self.afdata['endtime'] = np.repeat(endtime, len(self.afdata)).astype(np.datetime64)
+        # The times are the same for all the detections, let pandas broadcast the scalars:
+        self.afdata['starttime'] = pd.Timestamp(starttime)
+        self.afdata['endtime'] = pd.Timestamp(endtime)
 
-        logger.info('Start and end times: %s %s',
-                    str(self.afdata['starttime'][0]),
-                    str(self.afdata['endtime'][0]))
+        logger.info('Start and end times: %s %s', str(starttime), str(endtime))
 
     def _apply_timezone_offset(self, obstime):
         """Apply the time zone offset to the datetime objects."""
@@ -159,58 +173,79 @@ class ActiveFiresShapefileFiltering(object):
         """
         detections = self.afdata
 
-        lons = detections.longitude.values
-        lats = detections.latitude.values
-
         toc = time.time()
-        points_inside = get_global_mask_from_shapefile(shapefile, (lons, lats), start_geometries_index)
+        points_inside = get_global_mask_from_shapefile(shapefile, (detections.longitude, detections.latitude),
+                                                       start_geometries_index, project=self._project_detections)
         logger.debug("Time used checking inside polygon - mpl path method: %f", time.time() - toc)
 
-        self.afdata = detections[points_inside == inside]
+        self._keep_detections(points_inside == inside)
 
         if len(self.afdata) == 0:
             logger.debug("No fires after filtering on Polygon...")
         else:
             logger.debug("Number of detections after filtering on Polygon: %d", len(self.afdata))
 
+    def remove_spurious_detections(self):
+        """Remove the spurious detections, if any."""
+        self._keep_detections(~get_spurious_detections_mask(self.afdata))
+
+    def _project_detections(self, proj4str, lons, lats):
+        """Project the detections, reusing the points if the current detections are already projected."""
+        if self.projected_points is not None:
+            points_proj4str, points_detections, points = self.projected_points
+            if points_proj4str == proj4str and points_detections is self.afdata:
+                return points
+
+        points = project_points(proj4str, lons, lats)
+        self.projected_points = (proj4str, self.afdata, points)
+        return points
+
+    def _keep_detections(self, mask):
+        """Keep the detections given by the boolean mask, and their projected points."""
+        detections = self.afdata
+        self.afdata = detections[mask]
+        if self.projected_points is not None and self.projected_points[1] is detections:
+            proj4str, _, points = self.projected_points
+            self.projected_points = (proj4str, self.afdata, points[mask])
+
     def get_regional_filtermasks(self, shapefile, globstr):
         """Get the regional filter masks from the shapefile."""
         detections = self.afdata
 
-        lons = detections.longitude.values
-        lats = detections.latitude.values
+        logger.debug("Before ShapeGeometry instance - shapefile name = %s", shapefile)
+        logger.debug("Shape file glob-string = %s", globstr)
+        shape_geom = load_shape_geometry(shapefile, globstr)
 
-        logger.debug("Before ShapeGeometry instance - shapefile name = %s" % str(shapefile))
-        logger.debug("Shape file glob-string = %s" % str(globstr))
-        shape_geom = ShapeGeometry(shapefile, globstr)
-        shape_geom.load()
+        points = self._project_detections(shape_geom.proj4str, detections.longitude, detections.latitude)
 
-        p__ = pyproj.Proj(shape_geom.proj4str)
-        metersx, metersy = p__(lons, lats)
-        points = np.vstack([metersx, metersy]).T
+        # Find the polygons (test areas) each point is inside, querying the spatial index of all the polygons:
+        tree, geometry_indices = shape_geom.get_polygons_tree()
+        if _points_within_bounds(points, shapely.total_bounds(tree.geometries)).any():
+            point_indices, tree_indices = tree.query(shapely.points(points), predicate='within')
+        else:
+            logger.debug("No detections inside the bounding box of the test areas")
+            point_indices = tree_indices = np.zeros(0, dtype=np.intp)
+        region_indices = geometry_indices[tree_indices]
 
         regional_masks = {}
 
-        for attr, geometry in zip(shape_geom.attributes, shape_geom.geometries):
+        for idx, attr in enumerate(shape_geom.attributes):
             test_omr = attr['Testomr']
             all_inside_test_omr = False
             some_inside_test_omr = False
-            logger.debug(u'Test area: {}'.format(str(test_omr)))
+            logger.debug('Test area: %s', test_omr)
 
             regional_masks[test_omr] = {'mask': None, 'attributes': attr}
 
-            if isinstance(geometry, shapely.geometry.multipolygon.MultiPolygon):
-                regional_masks[test_omr]['mask'] = get_mask_from_multipolygon(points, geometry)
-            else:
-                shape = geometry
-                pth = Path(shape.exterior.coords)
-                regional_masks[test_omr]['mask'] = pth.contains_points(points)
+            mask = np.zeros(len(points), dtype=bool)
+            mask[point_indices[region_indices == idx]] = True
+            regional_masks[test_omr]['mask'] = mask
 
-            if sum(regional_masks[test_omr]['mask']) == len(points):
+            if mask.all():
                 all_inside_test_omr = True
                 some_inside_test_omr = True
                 logger.debug("All points inside test area!")
-            elif sum(regional_masks[test_omr]['mask']) > 0:
+            elif mask.any():
                 some_inside_test_omr = True
                 logger.debug("Some points inside test area!")
 
@@ -221,14 +256,19 @@ class ActiveFiresShapefileFiltering(object):
 
 
 def _read_data(filepath):
-    """Read the AF data."""
-    with open(filepath, 'r') as fpt:
-        return pd.read_csv(fpt, index_col=None, header=None, comment='#', names=COL_NAMES)
+    """Read the AF data.
+
+    The file is memory mapped and parsed by the pandas C parser, with the
+    column types given up front. The pyarrow engine can not be used, as it
+    does not support the comment lines.
+    """
+    return pd.read_csv(filepath, index_col=None, header=None, comment='#', names=COL_NAMES, dtype=COL_DTYPES,
+                       skipinitialspace=True, engine='c', memory_map=True)
 
 
 def get_metadata_from_filename(infile_pattern, filepath):
     """From the filename and its pattern get basic metadata of the satellite observations."""
-    p__ = Parser(infile_pattern)
+    p__ = get_trollsift_parser(infile_pattern)
     fname = os.path.basename(filepath)
     try:
         res = p__.parse(fname)
@@ -258,41 +298,76 @@ def store(output_filename, detections):
         return None
 
 
-def get_mask_from_multipolygon(points, geometry, start_idx=1):
-    """Get mask for points from a shapely Multipolygon."""
-    shape = geometry.geoms[0]
-    pth = Path(shape.exterior.coords)
-    mask = pth.contains_points(points)
-
-    if sum(mask) == len(points):
-        return mask
+def get_mask_from_multipolygon(points, geometry, start_idx=1, polygons=None):
+    """Get mask for points from a shapely Multipolygon.
 
-    constituent_part = geometry.geoms[start_idx:]
-    for shape in constituent_part.geoms:
-        pth = Path(shape.exterior.coords)
-        mask = np.logical_or(mask, pth.contains_points(points))
-        if sum(mask) == len(points):
+    Points inside a hole of a polygon are not inside. The polygons can be given
+    as (prepared) polygons if already available, instead of being created here.
+    """
+    if not _points_within_bounds(points, geometry.bounds).any():
+        return np.zeros(len(points), dtype=bool)
+
+    if polygons is None:
+        polygons = get_prepared_polygons(geometry)
+
+    # The first polygon is always tested, and then the ones from *start_idx* on,
+    # each polygon only once:
+    mask = np.zeros(len(points), dtype=bool)
+    for polygon in polygons[:1] + polygons[max(start_idx, 1):]:
+        mask |= _contains_points(polygon, points)
+        if mask.all():
             break
 
     return mask
 
 
-def get_global_mask_from_shapefile(shapefile, lonlats, start_geom_index=0):
-    """Given geographical (lon,lat) points get a mask to apply when filtering."""
+def _contains_points(polygon, points):
+    """Get the mask of the points inside the polygon, only testing those inside its bounding box."""
+    mask = np.zeros(len(points), dtype=bool)
+    inside_bbox = _points_within_bounds(points, polygon.bounds)
+    if inside_bbox.any():
+        mask[inside_bbox] = shapely.contains_xy(polygon, points[inside_bbox])
+
+    return mask
+
+
+def _points_within_bounds(points, bounds):
+    """Get the mask of the points inside the bounding box (xmin, ymin, xmax, ymax)."""
+    xmin, ymin, xmax, ymax = bounds
+    return ((points[:, 0] >= xmin) & (points[:, 0] <= xmax) &
+            (points[:, 1] >= ymin) & (points[:, 1] <= ymax))
+
+
+def get_global_mask_from_shapefile(shapefile, lonlats, start_geom_index=0, project=None):
+    """Given geographical (lon,lat) points get a mask to apply when filtering.
+
+    The points are projected to the projection of the shapefile by
+    *project(proj4str, lons, lats)*, by default project_points.
+    """
     lons, lats = lonlats
+    project = project or project_points
     logger.debug("Getting the global mask from file: shapefile file path = %s", str(shapefile))
-    shape_geom = ShapeGeometry(shapefile)
-    shape_geom.load()
-
-    p__ = pyproj.Proj(shape_geom.proj4str)
+    shape_geom = load_shape_geometry(shapefile)
 
     # There is only one geometry/multi-polygon!
     geometry = shape_geom.geometries[0]
 
-    metersx, metersy = p__(lons, lats)
-    points = np.vstack([metersx, metersy]).T
+    points = project(shape_geom.proj4str, lons, lats)
+
+    return get_mask_from_multipolygon(points, geometry, start_geom_index,
+                                      polygons=shape_geom.get_polygons(0))
 
-    return get_mask_from_multipolygon(points, geometry, start_geom_index)
+
+def project_points(proj4str, lons, lats):
+    """Project the geographical (lon,lat) points and return them as an array of (x, y) points.
+
+    The points are returned as a C-contiguous float64 array, which is what the
+    vectorized point in polygon tests work on without copying.
+    """
+    transformer = get_transformer_from_lonlat(proj4str)
+    metersx, metersy = transformer.transform(np.ascontiguousarray(lons, dtype=np.float64),
+                                             np.ascontiguousarray(lats, dtype=np.float64))
+    return np.column_stack((metersx, metersy))
 
 
 class ActiveFiresPostprocessing(Thread):
@@ -340,7 +415,7 @@ class ActiveFiresPostprocessing(Thread):
         """Set up the Posttroll communication and start the publisher."""
         logger.debug("Starting up... Input topic: %s", self.input_topic)
         now = datetime_utc2local(datetime.now(), self.timezone)
-        logger.debug("Output times for timezone: {zone} Now = {time}".format(zone=str(self.timezone), time=now))
+        logger.debug("Output times for timezone: %s Now = %s", self.timezone, now)
 
         tic = time.time()
         units = {'temperature': 'degC'}
@@ -362,18 +437,10 @@ class ActiveFiresPostprocessing(Thread):
                 self.options[item] = config[item]
 
         if isinstance(self.options.get('subscribe_topics'), str):
-            subscribe_topics = self.options.get('subscribe_topics').split(',')
-            for item in subscribe_topics:
-                if len(item) == 0:
-                    subscribe_topics.remove(item)
-            self.options['subscribe_topics'] = subscribe_topics
+            self.options['subscribe_topics'] = [item for item in self.options['subscribe_topics'].split(',') if item]
 
         if isinstance(self.options.get('publish_topics'), str):
-            publish_topics = self.options.get('publish_topics').split(',')
-            for item in publish_topics:
-                if len(item) == 0:
-                    publish_topics.remove(item)
-            self.options['publish_topics'] = publish_topics
+            self.options['publish_topics'] = [item for item in self.options['publish_topics'].split(',') if item]
 
     def signal_shutdown(self, *args, **kwargs):
         """Shutdown the Active Fires postprocessing."""
@@ -394,7 +461,7 @@ class ActiveFiresPostprocessing(Thread):
         if not file_ok:
             output_messages = self._generate_no_fires_messages(msg, NO_FIRES_TEXT)
             for output_msg in output_messages:
-                logger.debug("Sending message: %s", str(output_msg))
+                logger.debug("Sending message: %s", output_msg)
                 self.publisher.send(str(output_msg))
             return None
 
@@ -403,7 +470,7 @@ class ActiveFiresPostprocessing(Thread):
     def get_output_filepath_from_projname(self, projname, metadata):
         """From the projection-name (given in the config file) retrieve the output file path."""
         try:
-            pout = Parser(self.outfile_patterns_national[projname]['geojson_file_pattern'])
+            pout = get_trollsift_parser(self.outfile_patterns_national[projname]['geojson_file_pattern'])
         except KeyError:
             raise KeyError('Projection name %s not supported in configuration!' % projname)
 
@@ -425,7 +492,7 @@ class ActiveFiresPostprocessing(Thread):
 
         for output_msg in output_messages:
             if output_msg:
-                logger.debug("Sending message: %s", str(output_msg))
+                logger.debug("Sending message: %s", output_msg)
                 self.publisher.send(str(output_msg))
 
     def do_postprocessing_on_message(self, msg, filename):
@@ -437,7 +504,7 @@ class ActiveFiresPostprocessing(Thread):
         if len(afdata) == 0:
             output_messages = self._generate_no_fires_messages(msg, NO_FIRES_TEXT)
             for output_msg in output_messages:
-                logger.debug("Sending message: %s", str(output_msg))
+                logger.debug("Sending message: %s", output_msg)
                 self.publisher.send(str(output_msg))
             return
 
@@ -472,12 +539,13 @@ class ActiveFiresPostprocessing(Thread):
 
         # FIXME! If afdata is empty (len=0) then it seems all data are inside all regions!
         af_shapeff = ActiveFiresShapefileFiltering(afdata=afdata, platform_name=platform_name,
-                                                   timezone=self.timezone)
+                                                   timezone=self.timezone,
+                                                   projected_points=af_shapeff.projected_points)
         regional_fmask = af_shapeff.get_regional_filtermasks(self.regional_filtermask,
                                                              globstr=self.regional_shapefiles_globstr)
         regional_messages = self.regional_fires_filtering_and_publishing(msg, regional_fmask, af_shapeff)
         for region_msg in regional_messages:
-            logger.debug("Sending message: %s", str(region_msg))
+            logger.debug("Sending message: %s", region_msg)
             self.publisher.send(str(region_msg))
 
     def run(self):
@@ -485,7 +553,7 @@ class ActiveFiresPostprocessing(Thread):
         while self.loop:
             try:
                 msg = self.listener.output_queue.get(timeout=1)
-                logger.debug("Message: %s", str(msg.data))
+                logger.debug("Message: %s", msg.data)
             except Empty:
                 continue
             else:
@@ -504,7 +572,7 @@ class ActiveFiresPostprocessing(Thread):
 
         fmda['platform'] = afsff_obj.platform_name
 
-        pout = Parser(self.outfile_patterns_regional['default']['geojson_file_pattern'])
+        pout = get_trollsift_parser(self.outfile_patterns_regional['default']['geojson_file_pattern'])
 
         output_messages = []
         regions_with_detections = 0
@@ -550,22 +618,21 @@ class ActiveFiresPostprocessing(Thread):
         fmda = af_shapeff.metadata
         # metdata contains time and everything but it is not being transfered to the dataframe.attrs
 
-        pout = Parser(self.outfile_patterns_national['default']['geojson_file_pattern'])
+        pout = get_trollsift_parser(self.outfile_patterns_national['default']['geojson_file_pattern'])
         out_filepath = os.path.join(self.output_dir, pout.compose(fmda))
         logger.debug("Output file path = %s", out_filepath)
 
         # National filtering:
         af_shapeff.fires_shapefile_filtering(self.shp_borders)
 
+        # Remove spurious detections if any:
+        af_shapeff.remove_spurious_detections()
+
         # Metadata should be transfered here!
         afdata_ff = af_shapeff.get_af_data()
 
-        # Remove spurious detections if any:
-        afdata_ff = remove_spurious_detections(afdata_ff)
-        af_shapeff.afdata = afdata_ff
-
         if len(afdata_ff) > 0:
-            logger.debug("Doing the fires filtering: shapefile-mask = %s", str(self.shp_filtermask))
+            logger.debug("Doing the fires filtering: shapefile-mask = %s", self.shp_filtermask)
             af_shapeff.fires_shapefile_filtering(self.shp_filtermask, start_geometries_index=0, inside=False)
             afdata_ff = af_shapeff.get_af_data()
             logger.debug("After fires_shapefile_filtering: Number of fire detections left: %d", len(afdata_ff))
@@ -616,13 +683,13 @@ class ActiveFiresPostprocessing(Thread):
         else:
             self._fire_detection_id = {'date': datetime.utcnow(), 'counter': 0}
 
-    def update_fire_detection_id(self):
-        """Update the fire detection ID registry."""
+    def update_fire_detection_id(self, number_of_detections=1):
+        """Update the fire detection ID registry, counting up for the given number of detections."""
         now = datetime.utcnow()
         if self._fire_detection_id['date'].date() < now.date():
-            self._fire_detection_id = {'date': datetime.utcnow(), 'counter': 0}
+            self._fire_detection_id = {'date': now, 'counter': 0}
 
-        self._fire_detection_id['counter'] = self._fire_detection_id['counter'] + 1
+        self._fire_detection_id['counter'] = self._fire_detection_id['counter'] + number_of_detections
 
     def save_id_to_file(self):
         """Save the (current) detection id on disk.
@@ -654,12 +721,14 @@ class ActiveFiresPostprocessing(Thread):
 
     def add_unique_day_id(self, data_frame):
         """Add a unique detection id - date + a running number for the day."""
-        # Add id's to the detections:
+        # Add id's to the detections, updating the registry once for all of them:
         id_list = []
-        for _i in range(len(data_frame)):
-            self.update_fire_detection_id()
-            id_ = self._create_id_string()
-            id_list.append(id_)
+        if len(data_frame) > 0:
+            self.update_fire_detection_id(len(data_frame))
+            last_counter = self._fire_detection_id['counter']
+            prefix = self._fire_detection_id['date'].strftime('%Y%m%d') + '-'
+            id_list = [prefix + str(counter)
+                       for counter in range(last_counter - len(data_frame) + 1, last_counter + 1)]
 
         col = len(data_frame.columns)
         data_frame.insert(col, 'detection_id', id_list)
@@ -703,7 +772,7 @@ def check_file_type_okay(file_type):
 def get_filename_from_uri(uri):
     """Get the file name from the uri given."""
     logger.info('File uri: %s', str(uri))
-    url = urlparse(uri)
+    url = urlsplit(uri)
     return url.path
 
 
@@ -719,13 +788,7 @@ def generate_posttroll_topic(output_topic, region=None):
 
 def prepare_posttroll_message(input_msg, region=None):
     """Create the basic posttroll-message fields and return."""
-    to_send = input_msg.data.copy()
-    to_send.pop('dataset', None)
-    to_send.pop('collection', None)
-    to_send.pop('uri', None)
-    to_send.pop('uid', None)
-    to_send.pop('format', None)
-    to_send.pop('type', None)
+    to_send = {key: value for key, value in input_msg.data.items() if key not in _STRIP_KEYS}
     # FIXME! Check that the region_name is stored as a unicode string!
     if region:
         to_send['region_name'] = region['attributes']['Testomr']
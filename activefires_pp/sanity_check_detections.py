@@ -30,22 +30,29 @@ elsewhere on the globe, probably more frequent when the solar activity is high.
 """
 
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 
 def remove_spurious_detections(af_dataframe):
     """Check active fires data and return those that are not classified as spurious."""
-    spurious = (af_dataframe['tb']/af_dataframe['power'] > 1000) & (af_dataframe['tb'] > 310)
-    non_spurious = ~spurious
-    n_spurious = len(af_dataframe[spurious])
+    return af_dataframe[~get_spurious_detections_mask(af_dataframe)]
+
+
+def get_spurious_detections_mask(af_dataframe):
+    """Check active fires data and get the mask of the detections classified as spurious."""
+    tb = af_dataframe['tb'].to_numpy()
+    power = af_dataframe['power'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spurious = (tb > 310) & (tb / power > 1000)
+
+    n_spurious = np.count_nonzero(spurious)
     if n_spurious > 0:
         logger.info(f"Number of spurious detections filtered out = {n_spurious}")
-        for idx in range(len(af_dataframe[spurious])):
-            logger.info("({lon},{lat}): Tb4 = {tb4} FRP = {frp}".format(
-                lon=af_dataframe[spurious]['longitude'].values[idx],
-                lat=af_dataframe[spurious]['latitude'].values[idx],
-                tb4=af_dataframe[spurious]['tb'].values[idx],
-                frp=af_dataframe[spurious]['power'].values[idx]))
-
-    return af_dataframe[non_spurious]
+        # Extract the columns of the spurious detections once for the logging:
+        spurious_data = af_dataframe.loc[spurious, ['longitude', 'latitude', 'tb', 'power']].to_numpy().tolist()
+        for lon, lat, tb4, frp in spurious_data:
+            logger.info("({lon},{lat}): Tb4 = {tb4} FRP = {frp}".format(lon=lon, lat=lat, tb4=tb4, frp=frp))
+
+    return spurious
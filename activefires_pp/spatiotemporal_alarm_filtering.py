@@ -42,7 +42,7 @@ import logging
 import signal
 from queue import Empty
 from threading import Thread
-from requests.exceptions import HTTPError, ConnectionError
+from requests.exceptions import RequestException
 from posttroll.listener import ListenerContainer
 from posttroll.message import Message
 from posttroll.publisher import NoisyPublisher
@@ -62,7 +62,8 @@ from activefires_pp.config import get_xauthentication_token
 from activefires_pp.geojson_utils import read_geojson_data
 from activefires_pp.geojson_utils import get_geojson_files_in_observation_time_order
 from activefires_pp.geojson_utils import store_geojson_alarm
-from activefires_pp.api_posting import post_alarm
+from activefires_pp.api_posting import post_alarms
+from activefires_pp.api_posting import close_session
 
 from trollsift import Parser
 
@@ -147,18 +148,10 @@ class AlarmFilterRunner(Thread):
             self.options[item] = config[item]
 
         if isinstance(self.options.get('subscribe_topics'), str):
-            subscribe_topics = self.options.get('subscribe_topics').split(',')
-            for item in subscribe_topics:
-                if len(item) == 0:
-                    subscribe_topics.remove(item)
-            self.options['subscribe_topics'] = subscribe_topics
+            self.options['subscribe_topics'] = [item for item in self.options['subscribe_topics'].split(',') if item]
 
         if isinstance(self.options.get('publish_topics'), str):
-            publish_topics = self.options.get('publish_topics').split(',')
-            for item in publish_topics:
-                if len(item) == 0:
-                    publish_topics.remove(item)
-            self.options['publish_topics'] = publish_topics
+            self.options['publish_topics'] = [item for item in self.options['publish_topics'].split(',') if item]
 
     def signal_shutdown(self, *args, **kwargs):
         """Shutdown the Notifier process."""
@@ -170,7 +163,7 @@ class AlarmFilterRunner(Thread):
         while self.loop:
             try:
                 msg = self.listener.output_queue.get(timeout=1)
-                LOG.debug("Message: %s", str(msg.data))
+                LOG.debug("Message: %s", msg.data)
             except Empty:
                 continue
             else:
@@ -220,20 +213,18 @@ class AlarmFilterRunner(Thread):
     def send_alarms(self, geojson_alarms, msg):
         """Send the alarms: Create geojson file with alarm data, post it and publish message."""
         p__ = Parser(self.sos_alarms_file_pattern)
-        for idx, alarm in enumerate(geojson_alarms):
-            # Write alarm to a geojson file in the fire_alarms_dir destination:
-            # 1) Create the filename
-            # 2) Wite to a file
-            output_filename = store_geojson_alarm(self.fire_alarms_dir, p__, idx, alarm)
-            try:
-                post_alarm(alarm['features'], self.restapi_url, self._xauth_token)
-                LOG.info('Alarm sent - status OK')
-            except (HTTPError, ConnectionError):
-                LOG.exception('Failed sending alarm!')
-                LOG.error('Data: %s', str(alarm['features']))
+        # Write each alarm to a geojson file in the fire_alarms_dir destination:
+        output_filenames = [store_geojson_alarm(self.fire_alarms_dir, p__, idx, alarm)
+                            for idx, alarm in enumerate(geojson_alarms)]
+        try:
+            post_alarms([alarm['features'] for alarm in geojson_alarms], self.restapi_url, self._xauth_token)
+            LOG.info('Alarms sent - status OK')
+        except RequestException:
+            LOG.exception('Failed sending alarm(s)!')
 
+        for alarm, output_filename in zip(geojson_alarms, output_filenames):
             output_message = _create_output_message(msg, self.output_topic, alarm, output_filename)
-            LOG.debug("Sending message: %s", str(output_message))
+            LOG.debug("Sending message: %s", output_message)
             self.publisher.send(str(output_message))
 
     def close(self):
@@ -249,6 +240,7 @@ class AlarmFilterRunner(Thread):
                 self.publisher.stop()
             except Exception:
                 LOG.exception("Couldn't stop publisher.")
+        close_session()
 
 
 def get_xauthentication_filepath_from_environment():
@@ -374,7 +366,7 @@ def split_large_fire_clusters(features, large_fires_threshold):
             max_2comb = tup2
 
     if max_distance < large_fires_threshold:
-        LOG.debug("Only one cluster - (max_distance, threshold) = (%f, %f)" % (max_distance, large_fires_threshold))
+        LOG.debug("Only one cluster - (max_distance, threshold) = (%f, %f)", max_distance, large_fires_threshold)
         return {'only-one-cluster': list(features.values())}
 
     # Now we have located the two detections in the collection that are
@@ -410,6 +402,8 @@ def create_one_detection_from_collection(features):
         related_detection = True
 
     LOG.info("Related detection: %s" % str(related_detection))
+    # Copy, so the input detections are left untouched:
+    feature2save = dict(feature2save, properties=dict(feature2save["properties"]))
     feature2save["properties"]['related_detection'] = related_detection
     return feature2save
 
@@ -501,16 +495,15 @@ def get_distance_between_two_points(geo_point1, geo_point2):
 
 def _create_output_message(msg, topic, geojson, filename):
     """Create the output message from the input message and the geojson payload."""
-    to_send = msg.data.copy()
-    to_send.pop('type', None)
-    to_send['related_detection'] = geojson['features']['properties']['related_detection']
-    to_send['power'] = geojson['features']['properties']['power']
-    to_send['tb'] = geojson['features']['properties']['tb']
-    to_send['platform_name'] = geojson['features']['properties']['platform_name']
+    to_send = {key: value for key, value in msg.data.items() if key not in ('type', 'uid')}
+    properties = geojson['features']['properties']
+    to_send['related_detection'] = properties['related_detection']
+    to_send['power'] = properties['power']
+    to_send['tb'] = properties['tb']
+    to_send['platform_name'] = properties['platform_name']
     to_send['coordinates'] = geojson['features']['geometry']['coordinates']
     to_send['file'] = filename.name
     to_send['format'] = 'geojson'
     to_send['uri'] = str(filename)
-    to_send.pop('uid', None)
 
     return Message(topic, 'file', to_send)
@@ -29,6 +29,7 @@ import requests
 import responses
 import json
 from activefires_pp.api_posting import post_alarm
+from activefires_pp.api_posting import post_alarms
 
 PAST_ALARMS_MONSTERAS3 = """{"features": {"geometry": {"coordinates": [16.252192, 57.15242], "type": "Point"},
 "properties": {"confidence": 8, "observation_time": "2021-06-18T14:49:01.750000+02:00",
@@ -93,3 +94,37 @@ def test_send_alarm_post_log_messages(caplog):
 
     log_output = "Alarm posted: Response = <Response [200]>"
     assert log_output in caplog.text
+
+
+@responses.activate
+def test_send_alarms_post_all_and_raise_first_error():
+    """Test posting several alarms where one of the posts fail."""
+    features = json.loads(PAST_ALARMS_MONSTERAS3)
+    alarm = features['features']
+    restapi_url = "https://my-fake-example.org"
+
+    responses.add(responses.POST, restapi_url, status=200)
+    responses.add(responses.POST, restapi_url, status=500)
+    responses.add(responses.POST, restapi_url, status=200)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        post_alarms([alarm, alarm, alarm], restapi_url, max_concurrency=2)
+
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_send_alarm_post_body_is_json():
+    """Test that the alarm is posted as a json encoded body."""
+    features = json.loads(PAST_ALARMS_MONSTERAS3)
+    alarm = features['features']
+    restapi_url = "https://my-fake-example.org"
+
+    responses.add(responses.POST, restapi_url, status=200)
+
+    post_alarm(alarm, restapi_url, xauth='my-token')
+
+    request = responses.calls[0].request
+    assert json.loads(request.body) == alarm
+    assert request.headers['Content-Type'] == 'application/json; charset=utf-8'
+    assert request.headers['x-auth-satellite-alarm'] == 'my-token'
@@ -22,7 +22,11 @@
 
 """Test getting the yaml configurations from file."""
 
+from unittest.mock import patch
+import yaml
+
 from activefires_pp.config import read_config
+from activefires_pp.config import clear_config_cache
 from activefires_pp.config import get_xauthentication_token
 
 
@@ -63,3 +67,33 @@ def test_read_yaml_configuration_for_postprocessing(fake_yamlconfig_file_post_pr
 
     assert config['output']['regional']['default'] == {'geojson_file_pattern':
                                               'AFIMG_{platform:s}_d{start_time:%Y%m%d_t%H%M%S}_{region_name:s}.geojson'}  # noqa
+
+
+def test_read_config_is_cached_until_file_changes(fake_yamlconfig_file):
+    """Test that the parsed config is reused until the file on disk changes."""
+    clear_config_cache()
+    with patch('activefires_pp.config.yaml.load', wraps=yaml.load) as yaml_load:
+        config1 = read_config(fake_yamlconfig_file)
+        config2 = read_config(fake_yamlconfig_file)
+        assert yaml_load.call_count == 1
+        assert config1 == config2
+
+        with open(fake_yamlconfig_file, 'a') as fpt:
+            fpt.write("output_dir: /some/other/path\n")
+
+        config3 = read_config(fake_yamlconfig_file)
+        assert yaml_load.call_count == 2
+
+    assert config3['output_dir'] == '/some/other/path'
+    assert 'output_dir' not in config1
+
+
+def test_read_config_returns_a_copy(fake_yamlconfig_file):
+    """Test that modifying the config of one caller does not change the config of later callers."""
+    clear_config_cache()
+    config1 = read_config(fake_yamlconfig_file)
+    config1['output_dir'] = '/some/other/path'
+
+    config2 = read_config(fake_yamlconfig_file)
+    assert config2 is not config1
+    assert 'output_dir' not in config2
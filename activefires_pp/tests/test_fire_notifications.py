@@ -23,7 +23,12 @@
 """Unit testing the fire notifications."""
 
 import unittest
+import pytest
+import re
+import logging
+from types import SimpleNamespace
 from unittest.mock import patch
+from unittest.mock import Mock
 import yaml
 import io
 from posttroll.message import Message
@@ -31,6 +36,7 @@ from posttroll.message import Message
 from activefires_pp.fire_notifications import EndUserNotifier
 from activefires_pp.fire_notifications import EndUserNotifierRegional
 from activefires_pp.fire_notifications import get_recipients_for_region
+from activefires_pp.fire_notifications import get_base64_encoded_file_content
 
 TEST_CONFIG_FILE = "/home/a000680/usr/src/forks/activefires-pp/examples/fire_notifier.yaml"
 TEST_CONFIG_FILE_REGIONAL = "/home/a000680/usr/src/forks/activefires-pp/examples/fire_notifier_regional.yaml"
@@ -316,3 +322,246 @@ class TestNotifyEndUsersRegional(unittest.TestCase):
 
         assert result.region_name == 'Name of my area 2'
         assert result.region_code == '0114'
+
+
+@pytest.fixture
+def fake_notifier_environment():
+    """Fake the secrets, the host name, the configuration and the posttroll set up of the notifiers.
+
+    The national configuration is read by default.
+    """
+    with patch('activefires_pp.fire_notifications.netrc') as netrc, \
+            patch('activefires_pp.fire_notifications.socket.gethostname') as gethostname, \
+            patch('activefires_pp.fire_notifications.read_config') as read_config, \
+            patch('activefires_pp.fire_notifications.EndUserNotifier._setup_and_start_communication'):
+        netrc.return_value = MyNetrcMock()
+        gethostname.return_value = 'default'
+        read_config.return_value = yaml.load(io.StringIO(NAT_CONFIG), Loader=yaml.UnsafeLoader)
+        yield SimpleNamespace(gethostname=gethostname, read_config=read_config)
+
+
+@pytest.fixture
+def national_notifier(fake_notifier_environment):
+    """Get the end user notifier for the national fires."""
+    return EndUserNotifier("/my/config/file/path")
+
+
+@pytest.fixture
+def regional_notifier(fake_notifier_environment):
+    """Get the end user notifier for the regional fires."""
+    fake_notifier_environment.read_config.return_value = yaml.load(io.StringIO(REG_CONFIG), Loader=yaml.UnsafeLoader)
+    return EndUserNotifierRegional("/my/config/file/path")
+
+
+def test_get_options_topics_with_empty_items(fake_notifier_environment):
+    """Test that empty items in the comma separated topics are ignored."""
+    config = fake_notifier_environment.read_config.return_value
+    config['subscribe_topics'] = 'a,,b,'
+    config['publish_topics'] = ',,c'
+
+    this = EndUserNotifier("/my/config/file/path")
+
+    assert this.options['subscribe_topics'] == ['a', 'b']
+    assert this.options['publish_topics'] == ['c']
+    assert this.input_topic == 'a'
+
+
+def test_init_host_not_in_netrc(fake_notifier_environment):
+    """Test that the notifier fails at start up if the host has no secrets in the netrc file."""
+    fake_notifier_environment.gethostname.return_value = 'some_other_host'
+
+    with pytest.raises(IOError):
+        _ = EndUserNotifier("/my/config/file/path", netrcfile='/my/netrc/file')
+
+
+def test_create_message_content(national_notifier):
+    """Test creating the full message and the sub-messages from the fire detections."""
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [17.5 + idx, 59.5]},
+                 "properties": {"power": 1.5 + idx, "tb": 310.0,
+                                "observation_time": "2021-04-16T12:29:53.700000"}}
+                for idx in range(4)]
+
+    full_message, sub_messages = national_notifier.create_message_content(features, "\nUnsubscribe")
+
+    fires = ['59.500000 N, %f E\n  16 Apr 12:29\n  FRP: %7.3f MW\n' % (17.5 + idx, 1.5 + idx)
+             for idx in range(4)]
+    assert full_message == ''.join(fires) + "\nUnsubscribe"
+    assert sub_messages == [''.join(fires[0:3]) + "\nUnsubscribe", fires[3] + "\nUnsubscribe"]
+
+    full_message, sub_messages = national_notifier.create_message_content(iter(features[:3]), "")
+    assert full_message == ''.join(fires[:3])
+    assert sub_messages == [''.join(fires[:3])]
+
+    full_message, sub_messages = national_notifier.create_message_content([], "\nUnsubscribe")
+    assert full_message == ''
+    assert sub_messages == []
+
+
+def test_notify_end_users_invalid_geojson_file(national_notifier, tmp_path, caplog):
+    """Test that no notifications are sent if the geojson file cannot be read."""
+    filename = tmp_path / 'AFIMG_j01_d20210416_t122953.geojson'
+    filename.write_text('{"type": "FeatureCollection", "features": [')
+    national_notifier._smtp = Mock()
+
+    with caplog.at_level(logging.ERROR):
+        result = national_notifier.notify_end_users(Mock(data={'uri': str(filename)}))
+
+    assert result is None
+    assert "Geojson file invalid and cannot be read" in caplog.text
+    national_notifier._smtp.sendmail.assert_not_called()
+
+
+def test_notify_end_users_rendering_error(national_notifier, tmp_path, caplog):
+    """Test that an error rendering the notification is not taken for an invalid geojson file."""
+    filename = tmp_path / 'AFIMG_j01_d20210416_t122953.geojson'
+    filename.write_text('{"type": "FeatureCollection", "features": [{"type": "Feature", '
+                        '"geometry": {"type": "Point", "coordinates": [17.5, 59.5]}, '
+                        '"properties": {"power": 1.5, "observation_time": "not a time"}}]}')
+    national_notifier._smtp = Mock()
+
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(ValueError):
+            national_notifier.notify_end_users(Mock(data={'uri': str(filename)}))
+
+    assert "Geojson file invalid" not in caplog.text
+    national_notifier._smtp.sendmail.assert_not_called()
+
+
+def test_send_notifications_with_attachments(national_notifier, tmp_path):
+    """Test sending the notifications with the geojson file attached."""
+    server = Mock()
+    server.sendmail.return_value = {}
+    national_notifier._smtp = server
+    filename = tmp_path / 'AFIMG_j01_d20210416_t122953.geojson'
+    filename.write_text('{"type": "FeatureCollection", "features": []}')
+
+    national_notifier._send_notifications_with_attachments(national_notifier.recipients, 'My message',
+                                                           str(filename), 'NOAA-20')
+
+    server.sendmail.assert_called_once()
+    sender, to_addrs, txt = server.sendmail.call_args.args
+    txt = txt.decode('ascii')
+    assert sender == 'active-fires@mydomain.se'
+    assert to_addrs == ['recipient1@recipients.se', 'recipient2@recipients.se']
+    assert '\r\nTo: undisclosed-recipients:;\r\n' in txt
+    assert re.search('(?<!\r)\n', txt) is None
+    assert 'recipient1@recipients.se' not in txt
+    assert 'filename="AFIMG_j01_d20210416_t122953.geojson"' in txt
+
+
+def test_sendmail_logs_refused_recipients(national_notifier, caplog):
+    """Test that the recipients refused by the smtp server are logged, when the mail is sent to the others."""
+    server = Mock()
+    server.sendmail.return_value = {'recipient2@recipients.se': (550, b'5.1.1 User unknown')}
+    national_notifier._smtp = server
+
+    with caplog.at_level(logging.ERROR):
+        national_notifier._sendmail(['recipient1@recipients.se', 'recipient2@recipients.se'], b'My mail')
+
+    server.sendmail.assert_called_once()
+    assert "Notification refused for recipient recipient2@recipients.se: 550 b'5.1.1 User unknown'" in caplog.text
+    assert 'recipient1@recipients.se' not in caplog.text
+
+
+@patch('activefires_pp.fire_notifications.smtplib.SMTP')
+def test_send_notifications_without_attachments(smtp, national_notifier):
+    """Test sending the notifications without attachments over one smtp connection."""
+    this = national_notifier
+    this._send_notifications_without_attachments(this.recipients, ['Message 1', 'Message 2'], 'NOAA-20')
+    this._send_notifications_without_attachments(this.recipients, ['Message 3'], 'NOAA-20')
+
+    smtp.assert_called_once_with('smtp.mydomain.se')
+    server = smtp.return_value
+    server.login.assert_called_once_with('my_user', 'my_passwd')
+    assert server.sendmail.call_count == 3
+    for call in server.sendmail.call_args_list:
+        assert call.args[1] == ['recipient3@recipients.se']
+        # No bare line feeds in the mail data:
+        assert re.search(b'(?<!\r)\n', call.args[2]) is None
+
+    this.close()
+    server.quit.assert_called_once()
+    assert this._smtp is None
+
+
+@patch('activefires_pp.fire_notifications.time.monotonic')
+@patch('activefires_pp.fire_notifications.smtplib.SMTP')
+def test_smtp_reconnect_after_max_idle(smtp, monotonic, national_notifier):
+    """Test that the smtp connection is opened again after being idle too long."""
+    monotonic.return_value = 1000.0
+    national_notifier._get_smtp_server()
+    monotonic.return_value = 1100.0
+    national_notifier._get_smtp_server()
+    assert smtp.call_count == 1
+
+    monotonic.return_value = 1500.0
+    national_notifier._get_smtp_server()
+    assert smtp.call_count == 2
+    smtp.return_value.quit.assert_called_once()
+
+
+@patch('activefires_pp.fire_notifications.time.monotonic')
+@patch('activefires_pp.fire_notifications.smtplib.SMTP')
+def test_smtp_reconnect_after_max_idle_set_connection(smtp, monotonic, national_notifier):
+    """Test that a connection set before the first mail is used, and opened again after being idle too long."""
+    server = Mock()
+    national_notifier._smtp = server
+
+    monotonic.return_value = 1000.0
+    assert national_notifier._get_smtp_server() is server
+    smtp.assert_not_called()
+
+    monotonic.return_value = 1500.0
+    assert national_notifier._get_smtp_server() is smtp.return_value
+    server.quit.assert_called_once()
+    smtp.assert_called_once_with('smtp.mydomain.se')
+
+
+def test_handle_message(national_notifier):
+    """Test handling an incoming message in a sender thread, publishing the result."""
+    national_notifier.publisher = Mock()
+    input_msg = Message.decode(rawstr=NATIONAL_TEST_MESSAGE)
+
+    with patch.object(national_notifier, 'notify_end_users') as notify_end_users:
+        notify_end_users.return_value = 'my output message'
+        national_notifier._handle_message(input_msg)
+        national_notifier.publisher.send.assert_called_once_with('my output message')
+
+        notify_end_users.side_effect = IOError
+        national_notifier._handle_message(input_msg)
+        national_notifier.publisher.send.assert_called_once()
+
+
+def test_dispatch_message_skips_redelivered_messages(national_notifier):
+    """Test that a message received twice only generates notifications once."""
+    national_notifier._executor = Mock()
+
+    national_notifier._dispatch_message(Message.decode(rawstr=NATIONAL_TEST_MESSAGE))
+    national_notifier._dispatch_message(Message.decode(rawstr=NATIONAL_TEST_MESSAGE))
+
+    national_notifier._executor.submit.assert_called_once()
+
+
+def test_recipients_per_region_set_at_init(regional_notifier):
+    """Test that the recipients of each region are prepared when reading the configuration."""
+    assert sorted(regional_notifier._recipients_per_region) == ['0114', '0999']
+    result = regional_notifier._recipients_per_region['0999']
+    assert result.region_name == 'Name of my area 1'
+    assert result.subject == 'My subject'
+    assert result.recipients_all == ['active-fires-0999@mydomain.xx', 'active-fires-sms-0999@mydomain.xx']
+    assert result.recipients_with_attachment == ['active-fires-0999@mydomain.xx']
+    assert result.recipients_without_attachment == ['active-fires-sms-0999@mydomain.xx']
+
+
+def test_get_base64_encoded_file_content(tmp_path):
+    """Test getting the base64 encoded file content, cached until the file is modified."""
+    filename = tmp_path / 'AFIMG_j01_d20210416_t122953.geojson'
+    filename.write_bytes(b'{"type": "FeatureCollection", "features": []}')
+
+    encoded1 = get_base64_encoded_file_content(filename)
+    assert encoded1 == 'eyJ0eXBlIjogIkZlYXR1cmVDb2xsZWN0aW9uIiwgImZlYXR1cmVzIjogW119\n'
+    assert get_base64_encoded_file_content(filename) is encoded1
+
+    filename.write_bytes(b'{}')
+    assert get_base64_encoded_file_content(filename) == 'e30=\n'
+
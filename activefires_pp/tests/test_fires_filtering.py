@@ -33,13 +33,17 @@ import io
 import logging
 from datetime import datetime
 from freezegun import freeze_time
+from shapely.geometry import MultiPolygon, Polygon
 
 from activefires_pp.post_processing import ActiveFiresShapefileFiltering
 from activefires_pp.post_processing import ActiveFiresPostprocessing
 from activefires_pp.post_processing import COL_NAMES
+from activefires_pp.post_processing import _read_data
 from activefires_pp.tests.test_utils import AF_FILE_PATTERN
 from activefires_pp.utils import UnitConverter
 from activefires_pp.post_processing import geojson_feature_collection_from_detections
+from activefires_pp.post_processing import get_mask_from_multipolygon
+from activefires_pp.post_processing import project_points
 
 
 TEST_ACTIVE_FIRES_FILEPATH = "./AFIMG_j01_d20210414_t1126439_e1128084_b17637_c20210414114130392094_cspp_dev.txt"
@@ -185,6 +189,47 @@ def test_add_start_and_end_time_to_active_fires_data_utc(readdata, fake_active_f
     assert str(af_shpfile_filter.afdata['endtime'][0]) == '2021-04-14 11:28:08'
 
 
+def test_read_data(tmp_path):
+    """Test reading the active fires data from file."""
+    filepath = tmp_path / 'af_data.txt'
+    filepath.write_text(TEST_ACTIVE_FIRES_FILE_DATA)
+
+    afdata = _read_data(str(filepath))
+
+    assert afdata.shape == (18, 7)
+    assert afdata['latitude'].dtype == np.float64
+    assert afdata['conf'].dtype == np.float64
+    assert afdata['conf'].iloc[0] == 8
+
+
+def test_read_data_missing_confidence(tmp_path):
+    """Test reading the active fires data from file when a confidence value is missing."""
+    filepath = tmp_path / 'af_data.txt'
+    filepath.write_text("# column 6: detection confidence (%)\n"
+                        "  59.50899506,   17.81270599,  298.94497681,  0.391,  0.409,    ,     0.82861966\n"
+                        "  59.50891876,   17.81298447,  293.01828003,  0.391,  0.409,   7,     0.82861966\n")
+
+    afdata = _read_data(str(filepath))
+
+    assert afdata.shape == (2, 7)
+    assert np.isnan(afdata['conf'].iloc[0])
+    assert afdata['conf'].iloc[1] == 7
+    np.testing.assert_allclose(afdata['power'], [0.82861966, 0.82861966])
+
+
+def test_get_feature_collection_from_firedata_missing_confidence():
+    """Test that a missing confidence is written as null in the geojson feature collection."""
+    obstime = datetime(2023, 6, 16, 11, 10, 47)
+    afdata = pd.DataFrame({'latitude': [59.50899506, 59.50891876], 'longitude': [17.81270599, 17.81298447],
+                           'tb': [298.94497681, 293.01828003], 'conf': [np.nan, 7.0], 'power': [0.82861966, 0.8],
+                           'starttime': [obstime, obstime], 'endtime': [obstime, obstime]})
+
+    result = geojson_feature_collection_from_detections(afdata)
+
+    assert result['features'][0]['properties']['confidence'] is None
+    assert result['features'][1]['properties']['confidence'] == 7
+
+
 @patch('activefires_pp.post_processing._read_data')
 def test_add_start_and_end_time_to_active_fires_data_localtime(readdata, fake_active_fires_file_data):
     """Test adding start and end times to the active fires data."""
@@ -322,6 +367,48 @@ def test_regional_fires_filtering(setup_comm, gethostname,
     assert result[0] == "my fake output message"
 
 
+def test_projected_points_reused_between_the_filters():
+    """Test that the detections are projected once, and the points filtered together with the detections."""
+    proj4str = '+proj=utm +zone=33 +ellps=WGS84 +datum=WGS84 +units=m +no_defs'
+    afdata = pd.DataFrame({'longitude': [15.0, 18.5, 17.0], 'latitude': [58.0, 57.5, 60.0],
+                           'tb': [300.0, 330.0, 300.0], 'power': [1.0, 0.1, 1.0]})
+    this = ActiveFiresShapefileFiltering(afdata=afdata)
+
+    with patch('activefires_pp.post_processing.project_points', wraps=project_points) as project:
+        points = this._project_detections(proj4str, afdata.longitude, afdata.latitude)
+        # The second detection is spurious:
+        this.remove_spurious_detections()
+        assert len(this.afdata) == 2
+
+        kept_points = this._project_detections(proj4str, this.afdata.longitude, this.afdata.latitude)
+        assert project.call_count == 1
+        np.testing.assert_equal(kept_points, points[[0, 2]])
+
+        regional = ActiveFiresShapefileFiltering(afdata=this.afdata, projected_points=this.projected_points)
+        regional._project_detections(proj4str, this.afdata.longitude, this.afdata.latitude)
+        assert project.call_count == 1
+
+        # Other detections, or another projection, are projected again:
+        this.afdata = afdata
+        this._project_detections(proj4str, afdata.longitude, afdata.latitude)
+        assert project.call_count == 2
+        this._project_detections('EPSG:3006', afdata.longitude, afdata.latitude)
+        assert project.call_count == 3
+
+
+def test_get_mask_from_multipolygon_with_hole():
+    """Test that points inside a hole of a polygon are not masked as inside the multipolygon."""
+    polygon_with_hole = Polygon([(0, 0), (10, 0), (10, 10), (0, 10)],
+                                [[(4, 4), (6, 4), (6, 6), (4, 6)]])
+    triangle = Polygon([(20, 0), (30, 0), (30, 10)])
+    geometry = MultiPolygon([polygon_with_hole, triangle])
+    points = np.array([[5., 5.], [1., 1.], [25., 1.], [40., 40.]])
+
+    mask = get_mask_from_multipolygon(points, geometry)
+
+    np.testing.assert_array_equal(mask, [False, True, True, False])
+
+
 @patch('socket.gethostname')
 @patch('activefires_pp.post_processing.ActiveFiresPostprocessing._setup_and_start_communication')
 @patch('activefires_pp.post_processing.get_global_mask_from_shapefile', side_effect=[FAKE_MASK1, FAKE_MASK2])
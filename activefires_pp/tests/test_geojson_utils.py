@@ -39,6 +39,8 @@ from trollsift import Parser
 from activefires_pp.geojson_utils import store_geojson
 from activefires_pp.geojson_utils import geojson_feature_collection_from_detections
 from activefires_pp.geojson_utils import read_geojson_data
+from activefires_pp.geojson_utils import GeojsonReadError
+from activefires_pp.geojson_utils import iter_geojson_features
 from activefires_pp.geojson_utils import get_geojson_files_in_observation_time_order
 from activefires_pp.geojson_utils import store_geojson_alarm
 from activefires_pp.geojson_utils import map_coordinates_in_feature_collection
@@ -123,6 +125,30 @@ def test_read_and_get_geojson_data_from_file(fake_geojson_file):
                                       "platform_name": "NOAA-20", "power": 1.62920368, "tb": 325.2354126}
 
 
+def test_iter_geojson_features_from_file(fake_geojson_file):
+    """Test iterating over the features of a geojson file."""
+    features = list(iter_geojson_features(fake_geojson_file))
+
+    assert features == read_geojson_data(fake_geojson_file)['features']
+
+
+def test_iter_geojson_features_from_empty_file(fake_empty_geojson_file):
+    """Test iterating over the features of an empty geojson file."""
+    with pytest.raises(GeojsonReadError):
+        list(iter_geojson_features(fake_empty_geojson_file))
+
+
+def test_read_geojson_data_returns_new_data(fake_geojson_file):
+    """Test that modifying the data of one caller does not change the data of later callers."""
+    ffdata1 = read_geojson_data(fake_geojson_file)
+    ffdata1['features'][0]['properties']['power'] = 0.0
+    ffdata1['features'].pop()
+
+    ffdata2 = read_geojson_data(fake_geojson_file)
+    assert len(ffdata2['features']) == 3
+    assert ffdata2['features'][0]['properties']['power'] == 1.62920368
+
+
 def test_read_and_get_geojson_data_from_nonexisting_file(caplog, fake_nonexisting_geojson_file):
     """Test reading a geojson file when file is not there."""
     with caplog.at_level(logging.ERROR):
@@ -33,6 +33,9 @@ import pyproj
 
 from activefires_pp.geometries_from_shapefiles import ShapeGeometry
 from activefires_pp.geometries_from_shapefiles import _get_proj_filename_from_shapefile
+from activefires_pp.geometries_from_shapefiles import load_shape_geometry
+from activefires_pp.post_processing import ActiveFiresShapefileFiltering
+from activefires_pp.post_processing import get_global_mask_from_shapefile
 from activefires_pp.post_processing import get_mask_from_multipolygon
 
 TEST_CRS_PROJ = ('+proj=utm +ellps=GRS80 +a=6378137.0 +rf=298.257222101 +pm=0 +x_0=500000.0 ' +
@@ -190,8 +193,6 @@ def multipolygon_shapefile(tmp_path):
                          )
 def test_get_global_mask_from_shapefile(multipolygon_shapefile, lonlats, expected_ll):
     """From a shapefile test get a mask defining which points are inside the geometries."""
-    from activefires_pp.post_processing import get_global_mask_from_shapefile
-
     retv_mask = get_global_mask_from_shapefile(multipolygon_shapefile,
                                                (lonlats[0], lonlats[1]))
 
@@ -211,3 +212,48 @@ def test_get_mask_from_multipolygon(multipolygon_shapefile):
     retv_mask = get_mask_from_multipolygon(points, geometry)
 
     np.testing.assert_equal(retv_mask, expected)
+
+
+def test_load_shape_geometry_cached(multipolygon_shapefile):
+    """Test that the loaded shape geometry is reused as long as the shapefile is not modified."""
+    shape_geom1 = load_shape_geometry(multipolygon_shapefile)
+    shape_geom2 = load_shape_geometry(multipolygon_shapefile)
+    assert shape_geom1 is shape_geom2
+    assert len(shape_geom1.get_polygons(0)) == 2
+
+    shapefile = shape_geom1.filepaths[0]
+    fstat = os.stat(shapefile)
+    os.utime(shapefile, ns=(fstat.st_atime_ns, fstat.st_mtime_ns + 1000000000))
+    shape_geom3 = load_shape_geometry(multipolygon_shapefile)
+    assert shape_geom3 is not shape_geom1
+
+
+@pytest.fixture
+def regional_shapefile(tmp_path):
+    """Return a file path to a shapefile with two test areas, one of them a multipolygon."""
+    shape_path = tmp_path / 'regions'
+
+    region1 = MultiPolygon([Polygon(((14.0, 57.0), (16.0, 57.0), (16.0, 59.0), (14.0, 59.0))),
+                            Polygon(((18.0, 57.0), (19.0, 57.0), (19.0, 58.0), (18.0, 58.0)))])
+    region2 = Polygon(((16.0, 59.0), (18.0, 59.0), (18.0, 61.0), (16.0, 61.0)))
+
+    gpd.GeoDataFrame(pd.DataFrame({'Testomr': ['Area 1', 'Area 2'], 'Kod_omr': ['0001', '0002']}),
+                     crs=pyproj.CRS('EPSG:4326'),
+                     geometry=[region1, region2]).to_file(shape_path)
+
+    yield shape_path
+
+
+def test_get_regional_filtermasks(regional_shapefile):
+    """Test getting the masks of the detections inside each of the test areas."""
+    afdata = pd.DataFrame({'longitude': [15.0, 18.5, 17.0, 12.0],
+                           'latitude': [58.0, 57.5, 60.0, 56.0]})
+    this = ActiveFiresShapefileFiltering(afdata=afdata)
+
+    masks = this.get_regional_filtermasks(regional_shapefile, globstr='*.shp')
+
+    np.testing.assert_equal(masks['Area 1']['mask'], np.array([True, True, False, False]))
+    np.testing.assert_equal(masks['Area 2']['mask'], np.array([False, False, True, False]))
+    assert masks['Area 1']['attributes']['Kod_omr'] == '0001'
+    assert masks['Area 1']['some_inside_test_area'] is True
+    assert masks['Area 1']['all_inside_test_area'] is False
@@ -24,9 +24,11 @@
 
 import pytest
 from unittest.mock import patch
+from unittest.mock import Mock
 import pathlib
 import json
 import logging
+from requests.exceptions import ReadTimeout
 
 from activefires_pp.geojson_utils import read_geojson_data
 from activefires_pp.spatiotemporal_alarm_filtering import create_alarms_from_fire_detections
@@ -420,6 +422,31 @@ def test_alarm_filter_runner_call_spatio_temporal_alarm_filtering_has_alarms(sen
     assert result[0] == alarm
 
 
+@patch('activefires_pp.spatiotemporal_alarm_filtering.AlarmFilterRunner._setup_and_start_communication')
+@patch('activefires_pp.spatiotemporal_alarm_filtering.store_geojson_alarm')
+@patch('activefires_pp.spatiotemporal_alarm_filtering._create_output_message')
+@patch('activefires_pp.spatiotemporal_alarm_filtering.post_alarms')
+def test_send_alarms_posting_fails(post_alarms, create_output_message, store_geojson_alarm, setup_comm,
+                                   monkeypatch, fake_yamlconfig_file, fake_token_file, caplog):
+    """Test that the alarms are still published when posting them to the API fails."""
+    monkeypatch.setenv("FIREALARMS_XAUTH_FILEPATH", str(fake_token_file))
+    post_alarms.side_effect = ReadTimeout
+    create_output_message.return_value = "my fake output message"
+
+    alarm_runner = AlarmFilterRunner(str(fake_yamlconfig_file))
+    alarm_runner.publisher = Mock()
+
+    alarm = {"features": {"geometry": {"coordinates": [16.249069, 57.156235], "type": "Point"},
+                          "properties": {"observation_time": "2021-06-19T02:58:45.700000+02:00",
+                                         "platform_name": "NOAA-20"}, "type": "Feature"},
+             "type": "FeatureCollection"}
+    with caplog.at_level(logging.ERROR):
+        alarm_runner.send_alarms([alarm], None)
+
+    assert 'Failed sending alarm(s)!' in caplog.text
+    alarm_runner.publisher.send.assert_called_once_with("my fake output message")
+
+
 @pytest.mark.usefixtures("fake_token_file")
 @pytest.mark.usefixtures("fake_yamlconfig_file")
 @patch('activefires_pp.spatiotemporal_alarm_filtering.AlarmFilterRunner._setup_and_start_communication')
@@ -23,6 +23,7 @@
 """Unit testing the utility functions."""
 
 import pytest
+import pyproj
 from freezegun import freeze_time
 from datetime import datetime, timedelta
 from posttroll.message import Message
@@ -30,6 +31,8 @@ from posttroll.message import Message
 from activefires_pp.utils import get_filename_from_posttroll_message
 from activefires_pp.utils import datetime_utc2local
 from activefires_pp.utils import json_serial
+from activefires_pp.utils import get_trollsift_parser
+from activefires_pp.utils import get_transformer_from_lonlat
 
 NATIONAL_TEST_MESSAGE = """pytroll://VIIRS/L2/Fires/PP/National file safusr.u@lxserv1043.smhi.se 2021-04-19T11:16:49.519087 v1.01 application/json {"start_time": "2021-04-16T12:29:53", "end_time": "2021-04-16T12:31:18", "orbit_number": 1, "platform_name": "NOAA-20", "sensor": "viirs", "data_processing_level": "2", "variant": "DR", "orig_orbit_number": 17666, "uri": "ssh://lxserv1043.smhi.se//san1/polar_out/direct_readout/viirs_active_fires/filtered/AFIMG_j01_d20210416_t122953.geojson", "uid": "AFIMG_j01_d20210416_t122953.geojson", "type": "GEOJSON-filtered", "format": "geojson", "product": "afimg"}"""  # noqa
 
@@ -54,6 +57,27 @@ def test_json_serial():
     assert str(exception_raised) == "Type <class 'str'> not serializable"
 
 
+def test_get_trollsift_parser():
+    """Test getting the file name parser, created once per pattern."""
+    parser = get_trollsift_parser(AF_FILE_PATTERN)
+
+    assert get_trollsift_parser(AF_FILE_PATTERN) is parser
+    res = parser.parse("AFIMG_j01_d20210414_t1126439_e1128084_b17637_c20210414114130392094_cspp_dev.txt")
+    assert res['platform'] == 'j01'
+    assert res['start_time'] == datetime(2021, 4, 14, 11, 26, 43, 900000)
+
+
+def test_get_transformer_from_lonlat():
+    """Test getting the transformer from longitude/latitude, the same as pyproj.Proj and created once."""
+    transformer = get_transformer_from_lonlat('EPSG:3006')
+    assert get_transformer_from_lonlat('EPSG:3006') is transformer
+
+    xcoord, ycoord = transformer.transform(17.25905, 62.658012)
+    expected = pyproj.Proj('EPSG:3006')(17.25905, 62.658012)
+    assert xcoord == pytest.approx(expected[0])
+    assert ycoord == pytest.approx(expected[1])
+
+
 def test_get_filename_from_posttroll_message():
     """Test get the filename from the pytroll message data."""
     input_msg = Message.decode(rawstr=NATIONAL_TEST_MESSAGE)
@@ -24,11 +24,14 @@
 
 import cartopy.io.shapereader as shpreader
 from datetime import date, datetime, timezone
-from urllib.parse import urlparse
+from functools import lru_cache
+from urllib.parse import urlsplit
 import pathlib
 import logging
 import zoneinfo
 from pint import UnitRegistry
+import pyproj
+from trollsift import Parser
 
 LOG = logging.getLogger(__name__)
 
@@ -63,9 +66,26 @@ def json_serial(obj):
     raise TypeError("Type %s not serializable" % type(obj))
 
 
+@lru_cache(maxsize=32)
+def get_trollsift_parser(pattern):
+    """Get the trollsift parser for the file name pattern, created once per pattern."""
+    return Parser(pattern)
+
+
+@lru_cache(maxsize=32)
+def get_transformer_from_lonlat(projection):
+    """Get the transformer from longitude/latitude to the projection, created once per projection.
+
+    The transform is the same as done by pyproj.Proj, from the geodetic
+    coordinate system of the projection.
+    """
+    crs = pyproj.CRS(projection)
+    return pyproj.Transformer.from_crs(crs.geodetic_crs, crs, always_xy=True)
+
+
 def get_filename_from_posttroll_message(pytroll_message):
     """Get the filename from the Posttroll message."""
-    url = urlparse(pytroll_message.data.get('uri'))
+    url = urlsplit(pytroll_message.data.get('uri'))
     filepath = pathlib.Path(url.path)
     LOG.info('File path: %s', str(filepath))
     return filepath